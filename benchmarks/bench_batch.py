@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+# vim: set tw=78 et sw=4 ts=4 sts=4 fileencoding=utf-8:
+# SPDX-License-Identifier: GPL-2.0
+
+"""
+Compare decoding captured frames one `EthernetFrame` at a time with the
+columnar `FrameBatch` decoder, with and without NumPy.
+"""
+
+import argparse
+import os
+import random
+import struct
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(
+    __file__))))
+
+from sixlowham.batch import FrameBatch, _numpy
+from sixlowham.ethernet import EthernetFrame
+
+
+def makeframes(count, seed=0):
+    """
+    Generate IPv6 frames with random addresses and payloads of 0-256
+    bytes.
+    """
+    rnd = random.Random(seed)
+    payloads = [bytes(rnd.getrandbits(8) for _ in range(size))
+            for size in range(0, 257, 16)]
+    frames = []
+    for _ in range(count):
+        payload = rnd.choice(payloads)
+        frames.append(b'\x33\x33\x00\x00\x00\x01\x02\x00\x00\x00\x00\x01'
+                + b'\x86\xdd' + struct.pack('!LHBB16s16s',
+                    0x60000000 | rnd.getrandbits(20), len(payload), 59, 64,
+                    rnd.getrandbits(128).to_bytes(16, 'big'),
+                    rnd.getrandbits(128).to_bytes(16, 'big'))
+                + payload)
+    return frames
+
+
+def timeit(fn):
+    start = time.perf_counter()
+    fn()
+    return time.perf_counter() - start
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    parser.add_argument('--count', type=int, default=1000000,
+            help='Number of frames to decode')
+    args = parser.parse_args(args)
+
+    print('generating %d frames' % args.count)
+    frames = makeframes(args.count)
+    buffer = b''.join(frames)
+    offsets = [0]
+    for frame in frames:
+        offsets.append(offsets[-1] + len(frame))
+
+    # EthernetFrame decodes its payload on access, so ask for it.
+    results = [('per-object parse',
+        timeit(lambda: [EthernetFrame.parse(f).payload for f in frames]))]
+    results.append(('FrameBatch, pure Python',
+        timeit(lambda: FrameBatch(buffer, offsets, use_numpy=False))))
+    if _numpy():
+        results.append(('FrameBatch, NumPy',
+            timeit(lambda: FrameBatch(buffer, offsets, use_numpy=True))))
+    else:
+        print('NumPy is not installed, skipping the NumPy decoder')
+
+    baseline = results[0][1]
+    for (name, elapsed) in results:
+        print('%-32s %8.3f s %12.0f frames/s %8.1fx' % (name, elapsed,
+            args.count / elapsed, baseline / elapsed))
+
+
+if __name__ == '__main__':
+    main()
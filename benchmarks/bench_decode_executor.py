@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+# vim: set tw=78 et sw=4 ts=4 sts=4 fileencoding=utf-8:
+# SPDX-License-Identifier: GPL-2.0
+
+"""
+Compare decoding received frames on the event loop with decoding them in
+a process pool of 1-N workers: loopback throughput, how long the agent
+waits for us to ACK the frames it sends, and how many frames go to the
+pool at once.
+"""
+
+import argparse
+import concurrent.futures
+import os
+
+from harness import runloop, loopback, percentiles
+
+from sixlowham.batch import decodeframes
+
+
+class CountingExecutor(concurrent.futures.ProcessPoolExecutor):
+    """
+    Keep count of the batches and frames handed to the pool.
+    """
+    def __init__(self, *args, **kwargs):
+        super(CountingExecutor, self).__init__(*args, **kwargs)
+        self.batches = 0
+        self.frames = 0
+
+    def submit(self, fn, *args):
+        if fn is decodeframes:
+            self.batches += 1
+            self.frames += len(args[1]) - 1
+        return super(CountingExecutor, self).submit(fn, *args)
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    parser.add_argument('--count', type=int, default=5000,
+            help='Frames to loop back per measurement')
+    parser.add_argument('--size', type=int, default=500,
+            help='Payload size')
+    parser.add_argument('--workers', type=int,
+            default=max(2, os.cpu_count() or 1),
+            help='Largest process pool to try')
+    parser.add_argument('--batch-size', type=int, default=64,
+            help='Largest batch handed to the pool')
+    parser.add_argument('--batch-delay', type=float, default=0.005,
+            help='Longest a frame waits for its batch to fill, in seconds')
+    args = parser.parse_args(args)
+
+    payload = bytes(i & 0xff for i in range(args.size))
+    print('%-10s %10s   %-24s %-24s %s' % ('decode', 'frames/s',
+        'host ACK latency (ms)', 'enqueue to ACK (ms)', 'batch'))
+
+    for workers in range(args.workers + 1):
+        if workers:
+            executor = CountingExecutor(workers)
+            # Start the workers before we time anything.
+            list(executor.map(abs, range(workers)))
+            name = '%d worker%s' % (workers, '' if workers == 1 else 's')
+        else:
+            executor = None
+            name = 'inline'
+
+        try:
+            result = runloop(loopback(args.count, payload,
+                decode_executor=executor,
+                decode_batch_size=args.batch_size,
+                decode_batch_delay=args.batch_delay))
+        finally:
+            if executor is not None:
+                executor.shutdown()
+
+        if executor is not None:
+            batch = '%.1f' % (executor.frames / max(executor.batches, 1))
+        else:
+            batch = '-'
+        print('%-10s %10.0f   %-24s %-24s %s' % (name, result['rate'],
+            percentiles(result['ack_latency']),
+            percentiles(result['tx_latency']), batch))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,46 @@
+#!/usr/bin/env python3
+# vim: set tw=78 et sw=4 ts=4 sts=4 fileencoding=utf-8:
+# SPDX-License-Identifier: GPL-2.0
+
+"""
+Compare the default asyncio event loop with uvloop, looping frames
+through the stand-in agent in each framing mode.
+"""
+
+import argparse
+
+from harness import runloop, loopback, percentiles
+from sixlowham.agent import FRAMING_STUFFED, FRAMING_LENGTH
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    parser.add_argument('--count', type=int, default=5000,
+            help='Frames to loop back per measurement')
+    parser.add_argument('--size', type=int, default=500,
+            help='Payload size')
+    parser.add_argument('--read-size', type=int, default=65536,
+            help='Largest read from the agent pipe')
+    args = parser.parse_args(args)
+
+    loops = ['asyncio']
+    try:
+        import uvloop
+        loops.append('uvloop')
+    except ImportError:
+        print('uvloop is not installed, skipping it')
+
+    payload = bytes(i & 0xff for i in range(args.size))
+    print('%-8s %-8s %10s   %-24s %s' % ('loop', 'framing', 'frames/s',
+        'host ACK latency (ms)', 'enqueue to ACK (ms)'))
+    for loop in loops:
+        for framing in (FRAMING_STUFFED, FRAMING_LENGTH):
+            result = runloop(loopback(args.count, payload, framing=framing,
+                read_size=args.read_size), loop=loop)
+            print('%-8s %-8s %10.0f   %-24s %s' % (loop, framing,
+                result['rate'], percentiles(result['ack_latency']),
+                percentiles(result['tx_latency'])))
+
+
+if __name__ == '__main__':
+    main()
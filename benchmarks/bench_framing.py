@@ -0,0 +1,45 @@
+#!/usr/bin/env python3
+# vim: set tw=78 et sw=4 ts=4 sts=4 fileencoding=utf-8:
+# SPDX-License-Identifier: GPL-2.0
+
+"""
+Compare byte-stuffed and length-prefixed framing on the agent pipe, by
+looping frames through the stand-in agent.  Payloads are either random,
+or made entirely of bytes that byte stuffing has to escape.
+"""
+
+import argparse
+import random
+
+from harness import runloop, loopback, percentiles
+from sixlowham.agent import FRAMING_STUFFED, FRAMING_LENGTH
+from sixlowham.framing import STX, ETX, DLE
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    parser.add_argument('--count', type=int, default=5000,
+            help='Frames to loop back per measurement')
+    parser.add_argument('--sizes', default='64,512,1024',
+            help='Comma-separated payload sizes')
+    args = parser.parse_args(args)
+
+    rnd = random.Random(0)
+    special = STX + ETX + DLE
+    print('%-8s %-8s %-8s %10s   %s' % ('framing', 'payload', 'size',
+        'frames/s', 'host ACK latency (ms)'))
+    for size in [int(s) for s in args.sizes.split(',')]:
+        payloads = (
+            ('random', bytes(rnd.getrandbits(8) for _ in range(size))),
+            ('escaped', bytes(special[i % 3] for i in range(size))),
+        )
+        for (kind, payload) in payloads:
+            for framing in (FRAMING_STUFFED, FRAMING_LENGTH):
+                result = runloop(loopback(args.count, payload,
+                    framing=framing))
+                print('%-8s %-8s %-8d %10.0f   %s' % (framing, kind, size,
+                    result['rate'], percentiles(result['ack_latency'])))
+
+
+if __name__ == '__main__':
+    main()
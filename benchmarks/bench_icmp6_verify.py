@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+# vim: set tw=78 et sw=4 ts=4 sts=4 fileencoding=utf-8:
+# SPDX-License-Identifier: GPL-2.0
+
+"""
+Measure the per-packet cost of verifying ICMPv6 checksums on receive,
+and of rejecting a corrupt packet, against parsing without verification.
+"""
+
+import argparse
+import os
+import struct
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(
+    __file__))))
+
+from sixlowham.ethernet import EthernetFrame
+from sixlowham.ip6 import IP6Datagram
+from sixlowham.rfc1071 import checksum
+
+_ICMP6_ = 58
+
+
+def makeframe(size):
+    """
+    Build an Ethernet frame carrying an ICMPv6 echo request of the given
+    size.
+    """
+    source = bytes(range(16))
+    dest = bytes(range(16, 32))
+    message = b'\x80\x00\x00\x00' + bytes((i & 0xff)
+            for i in range(size - 4))
+    csum = checksum(source + dest
+            + struct.pack('!L3xB', len(message), _ICMP6_) + message)
+    message = message[:2] + struct.pack('!H', csum) + message[4:]
+    return b'\x33\x33\x00\x00\x00\x01\x02\x00\x00\x00\x00\x01\x86\xdd' \
+            + struct.pack('!LHBB16s16s', 0x60000000, len(message),
+                    _ICMP6_, 64, source, dest) + message
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    parser.add_argument('--number', type=int, default=20000,
+            help='Iterations per measurement')
+    args = parser.parse_args(args)
+
+    def measure(stmt):
+        return min(timeit.repeat(stmt, number=args.number, repeat=3)) \
+                / args.number * 1e6
+
+    print('%-8s %12s %12s %12s %12s' % ('size', 'verify',
+        'reject', 'parse', 'verify+parse'))
+    for size in (64, 256, 1024, 1232):
+        frame = makeframe(size)
+        corrupt = bytearray(frame)
+        corrupt[-1] ^= 0xff
+        corrupt = bytes(corrupt)
+
+        view = memoryview(frame)[14:]
+        corrupt_view = memoryview(corrupt)[14:]
+        assert IP6Datagram.verify(view)
+        assert not IP6Datagram.verify(corrupt_view)
+
+        def verify_then_parse():
+            if IP6Datagram.verify(memoryview(frame)[14:]):
+                EthernetFrame.parse(frame).payload
+
+        print('%-8d %9.2f us %9.2f us %9.2f us %9.2f us' % (size,
+            measure(lambda: IP6Datagram.verify(view)),
+            measure(lambda: IP6Datagram.verify(corrupt_view)),
+            measure(lambda: EthernetFrame.parse(frame).payload),
+            measure(verify_then_parse)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+# vim: set tw=78 et sw=4 ts=4 sts=4 fileencoding=utf-8:
+# SPDX-License-Identifier: GPL-2.0
+
+"""
+Time walking and parsing IPv6 datagrams carrying 0-8 extension headers
+ahead of an ICMPv6 message.
+"""
+
+import argparse
+import os
+import struct
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(
+    __file__))))
+
+from sixlowham.ip6 import walkheaders, IP6Datagram, HOP_BY_HOP_HEADER, \
+        ROUTING_HEADER, FRAGMENT_HEADER, DEST_OPTIONS_HEADER
+from sixlowham.rfc1071 import checksum
+
+_CHAIN_ = (HOP_BY_HOP_HEADER, DEST_OPTIONS_HEADER, ROUTING_HEADER,
+        FRAGMENT_HEADER)
+_ICMP6_ = 58
+
+
+def makedatagram(extensions):
+    """
+    Build a datagram with the given number of 16-byte extension headers (8
+    bytes for fragment headers) and a 64-byte echo request.
+    """
+    source = bytes(range(16))
+    dest = bytes(range(16, 32))
+    ids = [_CHAIN_[i % len(_CHAIN_)] for i in range(extensions)]
+    ids.append(_ICMP6_)
+
+    payload = b''
+    for (header_id, next_id) in zip(ids, ids[1:]):
+        if header_id == FRAGMENT_HEADER:
+            payload += bytes([next_id]) + bytes(7)
+        else:
+            payload += bytes([next_id, 1]) + bytes(14)
+
+    message = b'\x80\x00\x00\x00' + bytes(60)
+    csum = checksum(source + dest
+            + struct.pack('!L3xB', len(message), _ICMP6_) + message)
+    payload += message[:2] + struct.pack('!H', csum) + message[4:]
+
+    return struct.pack('!LHBB16s16s', 0x60000000, len(payload), ids[0], 64,
+            source, dest) + payload
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    parser.add_argument('--number', type=int, default=20000,
+            help='Iterations per measurement')
+    args = parser.parse_args(args)
+
+    print('%-10s %14s %14s %14s' % ('headers', 'walkheaders',
+        'verify', 'parse'))
+    for extensions in range(9):
+        datagram = makedatagram(extensions)
+        results = []
+        for stmt in (lambda: walkheaders(datagram, datagram[6], 40),
+                lambda: IP6Datagram.verify(datagram),
+                lambda: IP6Datagram.parse(datagram)):
+            elapsed = min(timeit.repeat(stmt, number=args.number,
+                repeat=3))
+            results.append(elapsed / args.number * 1e6)
+        print('%-10d %11.2f us %11.2f us %11.2f us'
+                % ((extensions,) + tuple(results)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+# vim: set tw=78 et sw=4 ts=4 sts=4 fileencoding=utf-8:
+# SPDX-License-Identifier: GPL-2.0
+
+"""
+Compare handing frames to reader processes through a `FrameRing` with
+fanning them out over AF_UNIX SOCK_SEQPACKET sockets.  Each frame carries
+the time it was written, so readers can measure the one-way latency.
+"""
+
+import argparse
+import json
+import os
+import socket
+import struct
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(
+    __file__))))
+
+from sixlowham.loadtest import LatencyHistogram
+from sixlowham.shmring import FrameRing, FrameRingOverrun
+
+_TIMESTAMP_ = struct.Struct('=Q')
+
+
+def ring_reader(name, count, poll):
+    received = 0
+    lost = 0
+    latency = LatencyHistogram()
+    with FrameRing.attach(name) as ring:
+        print('ready', flush=True)
+        while (received + lost) < count:
+            try:
+                result = ring.read()
+            except FrameRingOverrun as e:
+                lost += e.lost
+                continue
+            if result is None:
+                time.sleep(poll)
+                continue
+
+            (seq, view) = result
+            sent = _TIMESTAMP_.unpack_from(view)[0]
+            view.release()
+            if ring.valid(seq):
+                latency.add((time.monotonic_ns() - sent) / 1e9)
+                received += 1
+            else:
+                lost += 1
+    return (received, lost, latency)
+
+
+def socket_reader(path, count):
+    received = 0
+    latency = LatencyHistogram()
+    with socket.socket(socket.AF_UNIX, socket.SOCK_SEQPACKET) as sock:
+        sock.connect(path)
+        print('ready', flush=True)
+        while received < count:
+            frame = sock.recv(65536)
+            if not frame:
+                break
+            sent = _TIMESTAMP_.unpack_from(frame)[0]
+            latency.add((time.monotonic_ns() - sent) / 1e9)
+            received += 1
+    return (received, count - received, latency)
+
+
+def reader(args):
+    if args.transport == 'ring':
+        (received, lost, latency) = ring_reader(args.address, args.count,
+                args.poll)
+    else:
+        (received, lost, latency) = socket_reader(args.address, args.count)
+    print(json.dumps(dict(received=received, lost=lost,
+        p50=latency.percentile(50), p99=latency.percentile(99))))
+
+
+def produce(args, transport, readers):
+    """
+    Write frames to the given number of readers, returning the time taken
+    and the results from each reader.
+    """
+    payload = bytes(args.size - _TIMESTAMP_.size)
+    interval = (1.0 / args.rate) if args.rate else 0
+
+    if transport == 'ring':
+        ring = FrameRing.create(slot_count=args.slots,
+                slot_size=max(args.size, 64))
+        address = ring.name
+    else:
+        tmpdir = tempfile.mkdtemp()
+        address = os.path.join(tmpdir, 'fanout')
+        server = socket.socket(socket.AF_UNIX, socket.SOCK_SEQPACKET)
+        server.bind(address)
+        server.listen(readers)
+
+    procs = [subprocess.Popen([sys.executable, __file__, '--reader',
+        transport, address, '--count', str(args.count),
+        '--poll', str(args.poll)], stdout=subprocess.PIPE, text=True)
+        for _ in range(readers)]
+
+    try:
+        if transport == 'socket':
+            clients = [server.accept()[0] for _ in procs]
+        for proc in procs:
+            assert proc.stdout.readline().strip() == 'ready'
+
+        start = time.perf_counter()
+        for idx in range(args.count):
+            if interval:
+                delay = start + (idx * interval) - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+
+            frame = _TIMESTAMP_.pack(time.monotonic_ns()) + payload
+            if transport == 'ring':
+                ring.write(frame)
+            else:
+                for client in clients:
+                    client.send(frame)
+        elapsed = time.perf_counter() - start
+
+        if transport == 'socket':
+            for client in clients:
+                client.close()
+        results = [json.loads(proc.communicate()[0]) for proc in procs]
+    finally:
+        for proc in procs:
+            if proc.poll() is None:
+                proc.kill()
+        if transport == 'ring':
+            ring.close()
+        else:
+            server.close()
+            os.unlink(address)
+            os.rmdir(tmpdir)
+
+    return (elapsed, results)
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    parser.add_argument('--count', type=int, default=100000,
+            help='Frames to write')
+    parser.add_argument('--size', type=int, default=256,
+            help='Frame size')
+    parser.add_argument('--readers', default='1,2,4',
+            help='Comma-separated numbers of reader processes to try')
+    parser.add_argument('--rate', type=float, default=0,
+            help='Frames per second to write (default: as fast as possible)')
+    parser.add_argument('--slots', type=int, default=4096,
+            help='Ring buffer slots')
+    parser.add_argument('--poll', type=float, default=0.0001,
+            help='Seconds ring readers sleep when there is nothing to read')
+    parser.add_argument('--reader', nargs=2, metavar=('TRANSPORT',
+            'ADDRESS'), help=argparse.SUPPRESS)
+    args = parser.parse_args(args)
+
+    if args.reader:
+        (args.transport, args.address) = args.reader
+        reader(args)
+        return
+
+    print('%-8s %-8s %12s %12s %9s   %s' % ('transport', 'readers',
+        'us/frame', 'frames/s', 'lost', 'latency (ms)'))
+    for readers in [int(r) for r in args.readers.split(',')]:
+        for transport in ('ring', 'socket'):
+            (elapsed, results) = produce(args, transport, readers)
+            lost = sum(r['lost'] for r in results)
+            p50 = max(r['p50'] or 0 for r in results) * 1000.0
+            p99 = max(r['p99'] or 0 for r in results) * 1000.0
+            print('%-9s %-8d %12.2f %12.0f %9d   p50=%7.3f p99=%7.3f' % (
+                transport, readers, elapsed / args.count * 1e6,
+                args.count / elapsed, lost, p50, p99))
+
+
+if __name__ == '__main__':
+    main()
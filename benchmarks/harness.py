@@ -0,0 +1,119 @@
+# vim: set tw=78 et sw=4 ts=4 sts=4 fileencoding=utf-8:
+# SPDX-License-Identifier: GPL-2.0
+
+"""
+Shared code for the benchmarks that drive `SixLowHAMAgent` against the
+stand-in agent in loopback mode.
+"""
+
+import asyncio
+import json
+import os
+import struct
+import sys
+import tempfile
+import time
+
+_ROOT_ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, _ROOT_)
+
+# The stand-in agent runs as a subprocess, so it needs to find us too.
+os.environ['PYTHONPATH'] = os.pathsep.join([_ROOT_]
+        + os.environ.get('PYTHONPATH', '').split(os.pathsep)).rstrip(
+                os.pathsep)
+
+from sixlowham.agent import SixLowHAMAgent
+from sixlowham.loadtest import LatencyHistogram
+
+_ETHERTYPE_ = 0x88b5
+_DEST_MAC_ = b'\x02\x00\x00\x00\x00\xfe'
+
+
+def runloop(coro, loop='asyncio'):
+    """
+    Run a coroutine on the named event loop, 'asyncio' or 'uvloop'.
+    """
+    if loop == 'uvloop':
+        import uvloop
+        with asyncio.Runner(loop_factory=uvloop.new_event_loop) as runner:
+            return runner.run(coro)
+    return asyncio.run(coro)
+
+
+def percentiles(histogram):
+    """
+    Format the p50 and p99 of a latency histogram in milliseconds.
+    """
+    if not len(histogram):
+        return 'p50=     - p99=     -'
+    return 'p50=%6.3f p99=%6.3f' % (histogram.percentile(50) * 1000.0,
+            histogram.percentile(99) * 1000.0)
+
+
+async def loopback(count, payload, window=16, standin_args=(),
+        **agent_kwargs):
+    """
+    Send `count` frames carrying `payload` through the stand-in agent and
+    wait for them all to come back.  At most `window` frames are queued at
+    once.  Returns a dict with the round trip rate in frames per second,
+    and histograms of the latency from enqueue to ACK (`tx_latency`), and
+    of the time the stand-in agent waited for us to ACK the frames it sent
+    (`ack_latency`).
+    """
+    (fd, stats) = tempfile.mkstemp(suffix='.json')
+    os.close(fd)
+
+    agent = SixLowHAMAgent(agent_path=sys.executable,
+            agent_args=['-m', 'sixlowham.standin', '--loopback',
+                '--stats', stats] + list(standin_args),
+            **agent_kwargs)
+
+    loop = asyncio.get_running_loop()
+    connected = loop.create_future()
+    done = loop.create_future()
+    tx_latency = LatencyHistogram()
+    state = dict(sent=0, received=0)
+
+    def _send():
+        agent.send_ethernet_frame(_DEST_MAC_ + bytes(agent.if_mac)
+                + struct.pack('!H', _ETHERTYPE_) + payload)
+        state['sent'] += 1
+
+    def _on_connected(**kwargs):
+        if not connected.done():
+            connected.set_result(None)
+
+    def _on_sent(frame, latency, **kwargs):
+        tx_latency.add(latency)
+        if state['sent'] < count:
+            _send()
+
+    def _on_received(frame, **kwargs):
+        if frame.proto != _ETHERTYPE_:
+            return
+        state['received'] += 1
+        if (state['received'] >= count) and not done.done():
+            done.set_result(None)
+
+    agent.connected.connect(_on_connected)
+    agent.sentframe.connect(_on_sent)
+    agent.receivedframe.connect(_on_received)
+
+    try:
+        async with agent:
+            await asyncio.wait_for(connected, 30)
+            start = time.perf_counter()
+            for _ in range(min(window, count)):
+                _send()
+            await asyncio.wait_for(done, 60 + (count / 100.0))
+            elapsed = time.perf_counter() - start
+
+        with open(stats) as statsfile:
+            ack_latency = LatencyHistogram()
+            for latency in json.load(statsfile)['ack_latency']:
+                ack_latency.add(latency)
+    finally:
+        os.unlink(stats)
+
+    return dict(rate=count / elapsed, tx_latency=tx_latency,
+            ack_latency=ack_latency)
@@ -0,0 +1,36 @@
+#!/usr/bin/env python3
+# vim: set tw=78 et sw=4 ts=4 sts=4 fileencoding=utf-8:
+# SPDX-License-Identifier: GPL-2.0
+
+import importlib
+
+# Public names, and the modules they live in.  These are imported on first
+# use so that importing the package stays cheap.
+_LAZY_ATTRIBUTES_ = {
+        'EthernetMACAddress':   'ethernet',
+        'EthernetFrame':        'ethernet',
+        'IP6Address':           'ip6',
+        'IP6Datagram':          'ip6',
+        'ICMP6Message':         'icmp6',
+        'MulticastGroups':      'multicast',
+        'FrameBatch':           'batch',
+        'FrameRing':            'shmring',
+        'SixLowHAMAgent':       'agent',
+}
+
+__all__ = sorted(_LAZY_ATTRIBUTES_)
+
+
+def __getattr__(name):
+    module = _LAZY_ATTRIBUTES_.get(name)
+    if module is None:
+        raise AttributeError('module %r has no attribute %r' \
+                % (__name__, name))
+
+    value = getattr(importlib.import_module('.' + module, __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_LAZY_ATTRIBUTES_))
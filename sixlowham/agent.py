@@ -4,34 +4,29 @@
 
 import signalslot
 import weakref
+import time
 import asyncio
-import construct
+import collections
+import concurrent.futures
 import logging
+from itertools import accumulate
 
 from .ethernet import EthernetMACAddress, EthernetFrame
+from .ip6 import IP6Datagram, IP6Address
+from .icmp6 import MLDv2Report
+from .multicast import MulticastGroups, ALL_NODES, ALL_MLDV2_ROUTERS
+from .batch import decodeframes
+from .shmring import FrameRing
+from .framing import SOH, EOT, ACK, NAK, SYN, FS, SOH_STRUCT, \
+        CAP_LENGTH_FRAMING, StuffedFramer, LengthFramer
 from .util import tobytes, checktypes
 
-# Byte definitions
-SOH     = b'\x01'
-STX     = b'\x02'
-E_STX   = b'b'
-ETX     = b'\x03'
-E_ETX   = b'c'
-EOT     = b'\x04'
-ACK     = b'\x06'
-DLE     = b'\x10'
-E_DLE   = b'p'
-NAK     = b'\x15'
-SYN     = b'\x16'
-FS      = b'\x1c'
-
-# Structure of SOH struct.
-SOH_STRUCT = construct.Struct(
-        "mac" / EthernetMACAddress._STRUCT_,
-        "mtu" / construct.Int16ub,
-        "idx" / construct.Int32ub,
-        "name" / construct.PascalString(construct.Byte, "utf-8")
-)
+# Framing modes
+FRAMING_STUFFED = 'stuffed'
+FRAMING_LENGTH = 'length'
+
+# Host MLDv2 reports are sent here
+_MLDV2_MAC_ = bytes(ALL_MLDV2_ROUTERS.multicastmac)
 
 class SixLowHAMAgent(object):
     """
@@ -39,21 +34,49 @@ class SixLowHAMAgent(object):
     for sending and receiving Ethernet frames via the 6LoWHAM Agent.
     """
     def __init__(self, agent_path=None, if_name=None, \
-            if_mac=None, if_mtu=None, tx_attempts=3, log=None):
+            if_mac=None, if_mtu=None, tx_attempts=3, log=None, *,
+            agent_args=None, verify_checksums=False,
+            framing=FRAMING_STUFFED, restart=False, restart_delay=1.0,
+            restart_delay_max=60.0, restart_stable=60.0, tx_max_age=None,
+            decode_executor=None, decode_batch_size=64,
+            decode_batch_delay=0.005, read_size=65536,
+            multicast_filter=False, ring=None, loop=None):
+
+        # Accept integer delays
+        decode_batch_delay = float(decode_batch_delay)
+        restart_delay = float(restart_delay)
+        restart_delay_max = float(restart_delay_max)
+        restart_stable = float(restart_stable)
+        if tx_max_age is not None:
+            tx_max_age = float(tx_max_age)
 
         # Check data types
         checktypes(
                 ('agent_path',  agent_path,     str,                True),
+                ('agent_args',  agent_args,     list,               True),
                 ('if_name',     if_name,        str,                True),
                 ('if_mac',      if_mac,         EthernetMACAddress, True),
                 ('if_mtu',      if_mtu,         int,                True),
                 ('tx_attempts', tx_attempts,    int,                False),
+                ('verify_checksums', verify_checksums, bool,        False),
+                ('framing',     framing,        str,                False),
+                ('restart',     restart,        bool,               False),
+                ('tx_max_age',  tx_max_age,     float,              True),
+                ('decode_executor', decode_executor,
+                    concurrent.futures.Executor,                    True),
+                ('decode_batch_size', decode_batch_size, int,       False),
+                ('decode_batch_delay', decode_batch_delay, float,   False),
+                ('read_size',   read_size,      int,                False),
+                ('multicast_filter', multicast_filter, bool,        False),
+                ('ring',        ring,           FrameRing,          True),
+                ('loop',        loop,       asyncio.AbstractEventLoop,  True),
                 ('log',         log,            logging.Logger,     True)
         )
 
         # Interface settings.  Make a note of which ones were supplied
         # to us by the caller in case the agent gets stopped and re-started.
         self._agent_path = agent_path or '6lhagent'
+        self._agent_args = agent_args or []
         self._if_name_given = if_name is not None
         self._if_name = if_name
         self._if_mac_given = if_mac is not None
@@ -61,20 +84,55 @@ class SixLowHAMAgent(object):
         self._if_mtu_given = if_mtu is not None
         self._if_mtu = if_mtu
         self._tx_attempts = tx_attempts
+        self._verify_checksums = verify_checksums
+        self._restart = restart
+        self._restart_delay_min = restart_delay
+        self._restart_delay_max = restart_delay_max
+        self._restart_stable = restart_stable
+        self._tx_max_age = tx_max_age
+        self._decode_executor = decode_executor
+        self._decode_batch_size = decode_batch_size
+        self._decode_batch_delay = decode_batch_delay
+        self._read_size = read_size
+        self._multicast_filter = multicast_filter
+        self._ring = ring
+        self._loop_given = loop is not None
+        self._loop = loop
         self._log = log
 
+        if framing not in (FRAMING_STUFFED, FRAMING_LENGTH):
+            raise ValueError('Unknown framing mode %r' % framing)
+        self._framing = framing
+
         # Internal state
-        self._transport = None
+        self._process = None
         self._protocol = None
+        self._reader = None
+        self._restart_handle = None
+        self._restart_task = None
+        self._stable_handle = None
+        self._closed = None
         self._if_idx = None
+        self._connected = False
+        self._stopping = False
         self._frame_pending = False
         self._retries = tx_attempts
-        self._tx_buffer = []
+        self._tx_buffer = []    # (enqueue time, frame) tuples
+        self._rx_rejected = 0
+        self._rx_batch = []
+        self._rx_batch_handle = None
+        self._multicast = MulticastGroups()
+        self._if_link_local = None
+        self._rx_decoding = collections.deque()
+        self._restart_delay = restart_delay
+        self._exit_time = None
+        self._recovery_time = None
 
         # Public Signals
         self.connected = signalslot.Signal(name='connected')
         self.disconnected = signalslot.Signal(name='disconnected')
         self.receivedframe = signalslot.Signal(name='receivedframe')
+        self.sentframe = signalslot.Signal(name='sentframe')
 
     @property
     def if_name(self):
@@ -97,50 +155,167 @@ class SixLowHAMAgent(object):
         """
         return self._if_idx
 
-    @asyncio.coroutine
-    def start(self):
+    @property
+    def if_link_local(self):
+        """
+        Return the link-local address of the network interface, derived
+        from its MAC address.
+        """
+        return self._if_link_local
+
+    @property
+    def multicast(self):
+        """
+        Return the table of multicast groups the network interface is
+        listening to.  With `multicast_filter`, this only affects frames
+        going into the interface through `send_ethernet_frame`; frames the
+        interface sends out are always passed on.
+        """
+        return self._multicast
+
+    @property
+    def rx_rejected(self):
+        """
+        Return the number of received frames dropped due to a failed
+        checksum verification.
+        """
+        return self._rx_rejected
+
+    @property
+    def tx_queued(self):
+        """
+        Return the number of frames waiting to be sent (including any frame
+        currently being sent).
+        """
+        return len(self._tx_buffer)
+
+    @property
+    def rx_buffered(self):
         """
-        Start the TAP device agent.
+        Return the number of bytes read from the agent but not yet decoded.
         """
-        if self._transport is not None:
+        if self._protocol is None:
+            return 0
+        return self._protocol.framer.buffered
+
+    @property
+    def recovery_time(self):
+        """
+        Return the time in seconds between the agent last exiting
+        unexpectedly and the restarted agent completing its handshake, or
+        None if it has not been restarted.
+        """
+        return self._recovery_time
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        self.stop()
+        await self.wait()
+
+    async def start(self):
+        """
+        Start the TAP device agent.  This must be called from the event loop
+        given to the constructor, if one was given.  Otherwise, the agent
+        runs on whichever loop it was started from, until it is stopped.
+        """
+        if (self._process is not None) or (self._restart_task is not None):
             raise RuntimeError('agent already started')
 
-        args = [self._agent_path]
+        loop = asyncio.get_running_loop()
+        if not self._loop_given:
+            self._loop = loop
+        elif self._loop is not loop:
+            raise RuntimeError('agent started from a different event loop')
+
+        self._stopping = False
+        await self._spawn()
+
+    async def _spawn(self):
+        """
+        Launch the agent process, returning True if it was launched.  When
+        restarting, a `stop()` may have come in since the restart was
+        scheduled; if so, do nothing.
+        """
+        if self._stopping:
+            return False
+
+        args = [self._agent_path] + self._agent_args
 
-        if self._if_name_given:
+        # These are either what we were given, or what the agent told us
+        # before it exited (if we're restarting it).
+        if self._if_name is not None:
             args += ['-n', self._if_name]
-        if self._if_mac_given:
+        if self._if_mac is not None:
             args += ['-a', str(self._if_mac)]
-        if self._if_mtu_given:
+        if self._if_mtu is not None:
             args += ['-m', str(self._if_mtu)]
 
         if self._log:
             self._log.debug('Starting agent with arguments: %s', args)
 
-        (self._transport, self._protocol) = yield from \
-                asyncio.get_event_loop().subprocess_exec(
-                        lambda : SixLowHAMAgentProtocol(self),
-                        *args,
-                        stdin=asyncio.subprocess.PIPE,
-                        stdout=asyncio.subprocess.PIPE)
+        self._process = await asyncio.create_subprocess_exec(
+                *args,
+                stdin=asyncio.subprocess.PIPE,
+                stdout=asyncio.subprocess.PIPE)
+        self._protocol = SixLowHAMAgentProtocol(self)
+        self._reader = self._loop.create_task(
+                self._read_agent(self._process, self._protocol))
+
+        # We may have been told to stop while starting up.
+        if self._stopping:
+            self._send_frame(EOT)
+        return True
+
+    async def wait(self):
+        """
+        Wait for the agent to exit (and not be restarted).
+        """
+        if (self._process is None) and (self._restart_handle is None) \
+                and (self._restart_task is None):
+            return
+
+        if self._closed is None:
+            self._closed = self._loop.create_future()
+        await asyncio.shield(self._closed)
 
     def send_ethernet_frame(self, frame):
         """
-        Enqueue an Ethernet frame to be transmitted.
+        Enqueue an Ethernet frame to be delivered into the interface.  If
+        `multicast_filter` is enabled, frames for multicast groups the
+        interface is not listening to (see `multicast`) are dropped.
         """
         frame = tobytes(frame)
+        if self._multicast_filter \
+                and not self._multicast.accepts(frame[0:6]):
+            if self._log:
+                self._log.debug('Dropping unwanted multicast frame: %r',
+                        frame)
+            return
+
         if self._log:
             self._log.debug('Enqueueing frame: %r', frame)
 
-        self._tx_buffer.push(frame)
-        if not self._frame_pending:
+        self._tx_buffer.append((time.monotonic(), frame))
+        if self._connected and not self._frame_pending:
             self._send_next()
 
     def stop(self):
         """
-        Stop the agent.
+        Stop the agent.  It will not be restarted.
         """
-        self._send_frame(EOT)
+        self._stopping = True
+        if self._process is not None:
+            self._send_frame(EOT)
+        elif self._restart_handle is not None:
+            # Waiting to restart, so just don't.
+            self._restart_handle.cancel()
+            self._restart_handle = None
+            self._reset()
+        # Otherwise a restart is under way; it will see we're stopping and
+        # either not start the agent or stop it once started.
 
     def _report_frame_error(self, raw_frame):
         """
@@ -164,6 +339,7 @@ class SixLowHAMAgent(object):
             self._if_mtu = ifdata.mtu
             self._if_idx = ifdata.idx
             self._if_name = ifdata.name
+            self._configure_addresses()
 
             # Emit a signal from the event loop, catch all errors.
             def emit():
@@ -173,10 +349,65 @@ class SixLowHAMAgent(object):
                     if self._log is not None:
                         self._log.exception(
                             'Exception raised from connected signal')
-            asyncio.get_event_loop().call_soon(emit)
+            self._loop.call_soon(emit)
+
+            # Switch to length-prefixed framing if we both support it.  The
+            # agent waits for our ACK before sending anything else, so it's
+            # safe to switch straight after sending it.
+            if (self._framing == FRAMING_LENGTH) \
+                    and ((ifdata.caps or 0) & CAP_LENGTH_FRAMING):
+                self._send_frame(ACK + bytes([CAP_LENGTH_FRAMING]))
+                self._protocol.framer = LengthFramer()
+            else:
+                self._send_frame(ACK)
+
+            self._connected = True
+            if self._exit_time is not None:
+                self._recovery_time = time.monotonic() - self._exit_time
+                self._exit_time = None
+
+                # Only forget about the crashes once the agent has stayed
+                # up for a while.
+                self._stable_handle = self._loop.call_later(
+                        self._restart_stable, self._on_stable)
+                if self._log is not None:
+                    self._log.info('Agent recovered after %.3f sec, '
+                            '%d frames queued', self._recovery_time,
+                            len(self._tx_buffer))
+
+            # Send anything queued whilst we were disconnected.
+            if self._tx_buffer and not self._frame_pending:
+                self._send_next()
+            return
+
+        elif frametype == FS and (self._decode_executor is not None):
+            # Ethernet frame received, this gets decoded in the executor
+            # so just ACK it now.  The agent only sends the next frame once
+            # we ACK this one, so collect frames over several reads, until
+            # the batch is full or it has waited long enough.
+            self._rx_batch.append((time.monotonic(), framedata))
+            if len(self._rx_batch) >= self._decode_batch_size:
+                self._flush_rx_batch()
+            elif self._rx_batch_handle is None:
+                self._rx_batch_handle = self._loop.call_later(
+                        self._decode_batch_delay, self._flush_rx_batch)
 
         elif frametype == FS:
-            # Ethernet frame received
+            # Ethernet frame received.  Verify IPv6 checksums before we
+            # go to the trouble of decoding anything.
+            rxtime = time.monotonic()
+            if self._verify_checksums \
+                    and (framedata[12:14] == b'\x86\xdd') \
+                    and not IP6Datagram.verify(
+                            memoryview(framedata)[14:]):
+                self._rx_rejected += 1
+                if self._log is not None:
+                    self._log.debug(
+                            'Dropping frame with bad checksum %r',
+                            framedata)
+                self._send_frame(ACK)
+                return
+
             try:
                 etherframe = EthernetFrame.parse(framedata)
             except:
@@ -186,34 +417,163 @@ class SixLowHAMAgent(object):
                 self._send_frame(NAK)
                 return
 
-            def emit():
-                try:
-                    self.receivedframe.emit(frame=etherframe)
-                except:
-                    if self._log is not None:
-                        self._log.exception(
-                            'Exception raised from receivedframe signal')
-            asyncio.get_event_loop().call_soon(emit)
+            self._write_ring(framedata)
+            self._loop.call_soon(
+                    self._emit_receivedframe, etherframe, rxtime)
 
         elif frametype in (ACK, NAK):
             self._on_response(frametype == ACK)
 
         # Do we ACK or NAK this?
-        if frametype in (SOH, FS, SYN):
+        if frametype in (FS, SYN):
             self._send_frame(ACK)
         elif frametype not in (ACK, NAK):
             # Don't recognise the frame
             self._send_frame(NAK)
 
+    def _write_ring(self, framedata):
+        """
+        Hand a received Ethernet frame to any other processes reading the
+        ring buffer.  Only frames passed on by `receivedframe` are written:
+        not those we NAK (the agent sends them again), nor those dropped for
+        a bad checksum.  Frames go in the order they were received.
+        """
+        if self._ring is None:
+            return
+
+        try:
+            self._ring.write(framedata)
+        except ValueError:
+            if self._log is not None:
+                self._log.warning('Frame too large for ring buffer: %r',
+                        framedata)
+
+    def _configure_addresses(self):
+        """
+        Derive the link-local address from the interface MAC address, and
+        join the multicast groups that go with it.
+        """
+        link_local = IP6Address.fromeui48(self._if_mac)
+        if link_local == self._if_link_local:
+            return
+
+        if self._if_link_local is not None:
+            self._multicast.leave(ALL_NODES)
+            self._multicast.leave(self._if_link_local.solicitednode)
+
+        self._if_link_local = link_local
+        self._multicast.join(ALL_NODES)
+        self._multicast.join(link_local.solicitednode)
+
+    def _snoop_mld(self, etherframe):
+        """
+        Update the multicast group table from MLDv2 reports sent by the
+        host.
+        """
+        if bytes(etherframe.dest) != _MLDV2_MAC_:
+            return
+
+        try:
+            for header in etherframe.payload.headers:
+                if isinstance(header, MLDv2Report):
+                    self._multicast.applyreport(header)
+        except:
+            if self._log is not None:
+                self._log.debug('Failed to process MLD report in %r',
+                        etherframe, exc_info=1)
+
+    def _emit_receivedframe(self, etherframe, rxtime):
+        """
+        Emit a received frame, catch all errors.  `rxtime` is the
+        `time.monotonic()` time at which the frame was read from the agent.
+        """
+        self._snoop_mld(etherframe)
+        try:
+            self.receivedframe.emit(frame=etherframe, rxtime=rxtime)
+        except:
+            if self._log is not None:
+                self._log.exception(
+                    'Exception raised from receivedframe signal')
+
+    def _emit_sentframe(self, frame, latency):
+        """
+        Emit a sent frame, catch all errors.  `latency` is the time in
+        seconds between the frame being enqueued and the agent ACKing it.
+        """
+        try:
+            self.sentframe.emit(frame=frame, latency=latency)
+        except:
+            if self._log is not None:
+                self._log.exception(
+                    'Exception raised from sentframe signal')
+
+    def _flush_rx_batch(self):
+        """
+        Hand the received frames collected so far to the decode executor
+        as a single buffer.
+        """
+        if self._rx_batch_handle is not None:
+            self._rx_batch_handle.cancel()
+            self._rx_batch_handle = None
+
+        if not self._rx_batch:
+            return
+
+        (rxtimes, frames) = zip(*self._rx_batch)
+        self._rx_batch = []
+        self._rx_batch_handle = None
+
+        offsets = [0]
+        offsets.extend(accumulate(len(f) for f in frames))
+        buffer = b''.join(frames)
+        try:
+            future = self._loop.run_in_executor(
+                    self._decode_executor, decodeframes,
+                    buffer, offsets, self._verify_checksums)
+        except:
+            # e.g. the executor was shut down.  Don't lose the frames, and
+            # keep them in order behind any batches still being decoded.
+            if self._log is not None:
+                self._log.exception('Failed to submit frame batch to the '
+                        'decode executor, decoding inline')
+            future = self._loop.create_future()
+            future.set_result(decodeframes(
+                buffer, offsets, self._verify_checksums))
+        self._rx_decoding.append((future, rxtimes, frames))
+        future.add_done_callback(self._on_rx_batch_decoded)
+
+    def _on_rx_batch_decoded(self, future):
+        """
+        Emit the decoded frames from completed batches, in the order they
+        were received.
+        """
+        while self._rx_decoding and self._rx_decoding[0][0].done():
+            (future, rxtimes, frames) = self._rx_decoding.popleft()
+            try:
+                (etherframes, rejected) = future.result()
+            except:
+                if self._log is not None:
+                    self._log.exception('Failed to decode frame batch')
+                continue
+
+            self._rx_rejected += rejected
+            for (etherframe, rxtime, framedata) in zip(
+                    etherframes, rxtimes, frames):
+                if etherframe is not None:
+                    self._write_ring(framedata)
+                    self._emit_receivedframe(etherframe, rxtime)
+
     def _on_response(self, success):
         # Ignore if no frame was sent
-        if not self._tx_buffer:
+        if not (self._frame_pending and self._tx_buffer):
             return
 
         # Remove successful frames, reset retry counter
         if success:
-            self._tx_buffer.pop(0)
+            (enqueued, frame) = self._tx_buffer.pop(0)
             self._retries = self._tx_attempts
+            self._loop.call_soon(self._emit_sentframe,
+                    frame, time.monotonic() - enqueued)
 
         # Reset the frame pending flag
         self._frame_pending = False
@@ -224,18 +584,30 @@ class SixLowHAMAgent(object):
     def _send_next(self):
         assert not self._frame_pending
         while self._tx_buffer:
+            (enqueued, frame) = self._tx_buffer[0]
             if self._retries <= 0:
                 # Too many attempts, dropping frame
                 if self._log:
                     self._log.warning(
                             'Dropping frame %r after %d send attempts',
-                            self._tx_buffer[0], self._tx_attempts)
+                            frame, self._tx_attempts)
+                self._tx_buffer.pop(0)
+                self._retries = self._tx_attempts
+                continue
+
+            if (self._tx_max_age is not None) and \
+                    ((time.monotonic() - enqueued) > self._tx_max_age):
+                # Frame has been waiting too long, dropping frame
+                if self._log:
+                    self._log.warning(
+                            'Dropping frame %r after %.3f sec in queue',
+                            frame, time.monotonic() - enqueued)
                 self._tx_buffer.pop(0)
                 self._retries = self._tx_attempts
                 continue
 
             # Try sending this frame
-            self._send_frame(FS + self._tx_buffer[0])
+            self._send_frame(FS + frame)
             self._frame_pending = True
             self._retries -= 1
             return
@@ -246,24 +618,71 @@ class SixLowHAMAgent(object):
         self._retries = self._tx_attempts
 
     def _send_frame(self, frame):
-        # Apply byte stuffing
-        frame = frame.replace(DLE, DLE + E_DLE)
-        frame = frame.replace(STX, DLE + E_STX)
-        frame = frame.replace(ETX, DLE + E_ETX)
-
         # Send to stdin of the process
-        self._transport.get_pipe_transport(0).write(
-                STX + frame + ETX)
+        self._process.stdin.write(self._protocol.framer.encode(frame))
+
+    async def _read_agent(self, process, protocol):
+        """
+        Read the output of the agent until it exits.
+        """
+        try:
+            while True:
+                data = await process.stdout.read(self._read_size)
+                if not data:
+                    break
+                protocol.data_received(data)
+        finally:
+            await process.wait()
+            self._on_exit()
 
     def _on_exit(self):
-        # Clean up the transport and protocol
-        self._transport = None
+        # These frames were ACKed, so don't keep them waiting.
+        self._flush_rx_batch()
+
+        # Clean up the process and protocol
+        self._process = None
         self._protocol = None
+        self._reader = None
+        self._connected = False
+        if self._stable_handle is not None:
+            self._stable_handle.cancel()
+            self._stable_handle = None
+
+        # Any frame in flight will be sent again, but this counts as one of
+        # its attempts in case it was what brought the agent down.
+        self._frame_pending = False
 
-        # Reset the internal state
+        # Emit a signal from the event loop, catch all errors.
+        def emit():
+            try:
+                self.disconnected.emit(agent=self)
+            except:
+                if self._log is not None:
+                    self._log.exception(
+                        'Exception raised from disconnected signal')
+        self._loop.call_soon(emit)
+
+        if self._restart and not self._stopping:
+            # Keep the queue and interface settings, and bring the agent
+            # back with the same interface.
+            if self._exit_time is None:
+                self._exit_time = time.monotonic()
+
+            if self._log is not None:
+                self._log.warning('Agent exited, restarting in %.3f sec',
+                        self._restart_delay)
+            self._schedule_restart()
+        else:
+            self._reset()
+
+    def _reset(self):
+        """
+        Reset the internal state once the agent has stopped for good.
+        """
         self._tx_buffer = []
-        self._frame_pending = False
         self._retries = self._tx_attempts
+        self._exit_time = None
+        self._restart_delay = self._restart_delay_min
 
         # Reset the values for parameters not passed into the constructor
         if not self._if_name_given:
@@ -272,57 +691,89 @@ class SixLowHAMAgent(object):
             self._if_mac = None
         if not self._if_mtu_given:
             self._if_mtu = None
+        if not self._loop_given:
+            self._loop = None
+
+        # Wake up anyone waiting for us to stop
+        if self._closed is not None:
+            self._closed.set_result(None)
+            self._closed = None
+
+    def _schedule_restart(self):
+        """
+        Schedule a restart of the agent, backing off exponentially.
+        """
+        self._restart_handle = self._loop.call_later(
+                self._restart_delay, self._do_restart)
+        self._restart_delay = min(self._restart_delay * 2,
+                self._restart_delay_max)
+
+    def _on_stable(self):
+        """
+        The agent has stayed up long enough after a restart, so reset the
+        restart backoff.
+        """
+        self._stable_handle = None
+        self._restart_delay = self._restart_delay_min
+
+    def _do_restart(self):
+        """
+        Restart the agent after it exited unexpectedly.  If it fails to
+        start, try again later.
+        """
+        self._restart_handle = None
+        if self._stopping or (self._process is not None):
+            return
+
+        self._restart_task = self._loop.create_task(self._spawn())
+        self._restart_task.add_done_callback(self._on_restarted)
+
+    def _on_restarted(self, task):
+        self._restart_task = None
+        error = None if task.cancelled() else task.exception()
+        if error is None:
+            if not task.result():
+                # We were stopped before the agent could be started.
+                self._reset()
+            return
+
+        if self._log is not None:
+            self._log.error('Failed to restart agent: %s', error)
+        if self._stopping:
+            self._reset()
+        else:
+            self._schedule_restart()
 
 
-class SixLowHAMAgentProtocol(asyncio.SubprocessProtocol):
+class SixLowHAMAgentProtocol(object):
     """
     Implements the de-serialisation of agent frames and passes these
     back to the parent SixLowHAMAgent object.
     """
     def __init__(self, agent):
         self._agent = weakref.ref(agent)
-        self._buffer = b''
+        self.framer = StuffedFramer()
 
-    def pipe_connection_lost(self, fd, exc):
-        pass
+    def data_received(self, data):
+        while data:
+            framer = self.framer
 
-    def process_exited(self):
-        self._agent._on_exit()
+            # Decode all frames, discard any that cause issues.
+            for frame in framer.decode(data):
+                if not frame:
+                    self._agent()._report_frame_error(frame)
+                    continue
 
-    def pipe_data_received(self, fd, data):
-        # Pull in the data received
-        self._buffer += data
-
-        # Process all pending frames
-        framestart = self._buffer.find(STX)
-        pending = []
-        while framestart >= 0:
-            frameend = self._buffer.find(ETX, framestart)
-            if frameend < 0:
-                break
-
-            frame = self._buffer[framestart+1:frameend]
-            self._buffer = self._buffer[frameend+1:]
-            pending.append(frame)
-
-        # Decode all frames, discard any that cause issues.
-        for raw_frame in pending:
-            try:
-                decoded_frame = self._process_raw_frame(raw_frame)
-            except:
-                self._agent()._report_frame_error(raw_frame)
-                continue
+                try:
+                    self._agent()._on_receive_frame(frame)
+                except:
+                    pass
 
-            try:
-                self._agent()._on_receive_frame(decoded_frame)
-            except:
-                pass
+                if framer is not self.framer:
+                    break
 
-    def _process_raw_frame(self, rawframe):
-        """
-        Replace the byte-stuffing sequences and return it.
-        """
-        frame = rawframe.replace(self.DLE + self.E_STX, self.STX)
-        frame = frame.replace(self.DLE + self.E_ETX, self.ETX)
-        frame = frame.replace(self.DLE + self.E_DLE, self.DLE)
-        return frame
+            # If the framing mode changed, hand anything left over to the
+            # new framer.
+            if framer is self.framer:
+                break
+            data = framer.flush()
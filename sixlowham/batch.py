@@ -0,0 +1,308 @@
+#!/usr/bin/env python3
+# vim: set tw=78 et sw=4 ts=4 sts=4 fileencoding=utf-8:
+# SPDX-License-Identifier: GPL-2.0
+
+import struct
+from array import array
+from itertools import accumulate
+
+from .ethernet import EthernetFrame
+from .ip6 import IP6Datagram
+
+# Ethernet header: destination, source, ethertype
+_ETHERNET_HEADER_ = struct.Struct('!6s6sH')
+
+# IPv6 fixed header: version/class/flow, payload length, next header,
+# hop limit, source, destination
+_IP6_HEADER_ = struct.Struct('!LHBB16s16s')
+
+_IP6_ETHERTYPE_ = 0x86dd
+
+# Frames decoded per step of the NumPy path.  Gathering the headers builds
+# index arrays of (frames x header bytes), so this bounds memory use.
+_NUMPY_CHUNK_ = 65536
+
+_NUMPY_ = None
+
+
+def _numpy():
+    """
+    Return the NumPy module, or False if it is not installed.
+    """
+    global _NUMPY_
+    if _NUMPY_ is None:
+        try:
+            import numpy
+            _NUMPY_ = numpy
+        except ImportError:
+            _NUMPY_ = False
+    return _NUMPY_
+
+
+class FrameBatch(object):
+    """
+    A batch of decoded frames, stored as columns.  Rather than building an
+    `EthernetFrame` and `IP6Datagram` per frame, the Ethernet and IPv6 fixed
+    headers of all frames are decoded in one pass over a contiguous buffer.
+    Payloads are not copied, only their offsets are recorded.
+
+    Each column has one entry per frame.  MAC and IPv6 addresses are stored
+    as contiguous byte strings with a fixed stride (6 and 16 bytes
+    respectively).  IPv6 columns are zero for frames that did not carry a
+    valid IPv6 header; see `ip6`.
+
+    If NumPy is installed, the headers are gathered with vectorised
+    operations rather than a loop over the frames.  `use_numpy` can be set
+    to False to force the pure Python decoder, or True to insist on NumPy.
+    """
+
+    def __init__(self, buffer, offsets, use_numpy=None):
+        self._buffer = memoryview(buffer)
+        self._offsets = array('L', offsets)
+
+        count = len(self._offsets) - 1
+        if count < 0:
+            raise ValueError('offsets must contain at least one entry')
+
+        self.dest = bytearray(6 * count)
+        self.source = bytearray(6 * count)
+        self.ethertype = array('H', [0]) * count
+        self.ip6 = array('B', [0]) * count
+        self.trafficclass = array('B', [0]) * count
+        self.flowlabel = array('L', [0]) * count
+        self.payload_len = array('H', [0]) * count
+        self.next_header = array('B', [0]) * count
+        self.hop_limit = array('B', [0]) * count
+        self.ip6_source = bytearray(16 * count)
+        self.ip6_dest = bytearray(16 * count)
+        self.payload_offset = array('L', [0]) * count
+        self.payload_length = array('L', [0]) * count
+
+        numpy = _numpy() if use_numpy in (None, True) else False
+        if numpy:
+            self._decode_numpy(numpy, count)
+        elif use_numpy:
+            raise ImportError('NumPy is not installed')
+        else:
+            self._decode(count)
+
+    def _decode(self, count):
+        buffer = self._buffer
+        offsets = self._offsets
+        eth_unpack = _ETHERNET_HEADER_.unpack_from
+        eth_size = _ETHERNET_HEADER_.size
+        ip6_unpack = _IP6_HEADER_.unpack_from
+        ip6_size = _IP6_HEADER_.size
+
+        for idx in range(count):
+            start = offsets[idx]
+            end = offsets[idx + 1]
+            if (end - start) < eth_size:
+                # Runt frame, leave everything zeroed.
+                self.payload_offset[idx] = end
+                continue
+
+            (dest, source, ethertype) = eth_unpack(buffer, start)
+            self.dest[idx*6:(idx+1)*6] = dest
+            self.source[idx*6:(idx+1)*6] = source
+            self.ethertype[idx] = ethertype
+
+            start += eth_size
+            if (ethertype == _IP6_ETHERTYPE_) \
+                    and ((end - start) >= ip6_size):
+                (vcf, payload_len, next_header, hop_limit,
+                        ip6_source, ip6_dest) = ip6_unpack(buffer, start)
+
+                if (vcf >> 28) == 6:
+                    self.ip6[idx] = 1
+                    self.trafficclass[idx] = (vcf >> 20) & 0xff
+                    self.flowlabel[idx] = vcf & 0xfffff
+                    self.payload_len[idx] = payload_len
+                    self.next_header[idx] = next_header
+                    self.hop_limit[idx] = hop_limit
+                    self.ip6_source[idx*16:(idx+1)*16] = ip6_source
+                    self.ip6_dest[idx*16:(idx+1)*16] = ip6_dest
+
+                    start += ip6_size
+                    end = min(end, start + payload_len)
+
+            self.payload_offset[idx] = start
+            self.payload_length[idx] = end - start
+
+    def _decode_numpy(self, numpy, count):
+        buffer = numpy.frombuffer(self._buffer, dtype=numpy.uint8)
+        offsets = numpy.frombuffer(self._offsets,
+                dtype=numpy.dtype(self._offsets.typecode)).astype(numpy.int64)
+        eth_size = _ETHERNET_HEADER_.size
+        ip6_size = _IP6_HEADER_.size
+
+        # Views of the columns, so we can fill them in place.
+        dest = numpy.frombuffer(self.dest, dtype=numpy.uint8) \
+                .reshape(count, 6)
+        source = numpy.frombuffer(self.source, dtype=numpy.uint8) \
+                .reshape(count, 6)
+        ip6_source = numpy.frombuffer(self.ip6_source, dtype=numpy.uint8) \
+                .reshape(count, 16)
+        ip6_dest = numpy.frombuffer(self.ip6_dest, dtype=numpy.uint8) \
+                .reshape(count, 16)
+        def column(name):
+            column = getattr(self, name)
+            return numpy.frombuffer(column,
+                    dtype=numpy.dtype(column.typecode))
+
+        ethertype = column('ethertype')
+        ip6 = column('ip6')
+        trafficclass = column('trafficclass')
+        flowlabel = column('flowlabel')
+        payload_len = column('payload_len')
+        next_header = column('next_header')
+        hop_limit = column('hop_limit')
+        payload_offset = column('payload_offset')
+        payload_length = column('payload_length')
+
+        eth_span = numpy.arange(eth_size)
+        ip6_span = numpy.arange(ip6_size) + eth_size
+
+        for first in range(0, count, _NUMPY_CHUNK_):
+            last = min(first + _NUMPY_CHUNK_, count)
+            starts = offsets[first:last]
+            ends = offsets[first+1:last+1]
+
+            # Runt frames are left zeroed, with an empty payload.
+            payload_start = ends.copy()
+            payload_end = ends.copy()
+
+            idx = numpy.nonzero((ends - starts) >= eth_size)[0]
+            headers = buffer[starts[idx, None] + eth_span]
+            frames = idx + first
+            dest[frames] = headers[:, 0:6]
+            source[frames] = headers[:, 6:12]
+            types = (headers[:, 12].astype(numpy.uint16) << 8) \
+                    | headers[:, 13]
+            ethertype[frames] = types
+            payload_start[idx] = starts[idx] + eth_size
+
+            # Frames long enough for an IPv6 header and that claim to be
+            # IPv6 version 6.
+            idx = idx[(types == _IP6_ETHERTYPE_)
+                    & ((ends[idx] - starts[idx]) >= (eth_size + ip6_size))]
+            headers = buffer[starts[idx, None] + ip6_span]
+            valid = (headers[:, 0] >> 4) == 6
+            idx = idx[valid]
+            headers = headers[valid]
+            frames = idx + first
+
+            vcf = numpy.ascontiguousarray(headers[:, 0:4]) \
+                    .view('>u4')[:, 0]
+            length = numpy.ascontiguousarray(headers[:, 4:6]) \
+                    .view('>u2')[:, 0]
+            ip6[frames] = 1
+            trafficclass[frames] = (vcf >> 20) & 0xff
+            flowlabel[frames] = vcf & 0xfffff
+            payload_len[frames] = length
+            next_header[frames] = headers[:, 6]
+            hop_limit[frames] = headers[:, 7]
+            ip6_source[frames] = headers[:, 8:24]
+            ip6_dest[frames] = headers[:, 24:40]
+
+            payload_start[idx] = starts[idx] + eth_size + ip6_size
+            payload_end[idx] = numpy.minimum(ends[idx],
+                    payload_start[idx] + length)
+
+            payload_offset[first:last] = payload_start
+            payload_length[first:last] = payload_end - payload_start
+
+    @classmethod
+    def fromframes(cls, frames, use_numpy=None):
+        """
+        Decode a sequence of raw frames (anything supporting the buffer
+        protocol).  The frames are joined into a single buffer first.
+        """
+        frames = list(frames)
+        offsets = [0]
+        offsets.extend(accumulate(len(f) for f in frames))
+        return cls(b''.join(frames), offsets, use_numpy=use_numpy)
+
+    @property
+    def buffer(self):
+        return self._buffer
+
+    @property
+    def offsets(self):
+        return self._offsets
+
+    def __len__(self):
+        return len(self._offsets) - 1
+
+    def frame(self, idx):
+        """
+        Return a view of the raw frame at the given index.
+        """
+        return self._buffer[self._offsets[idx]:self._offsets[idx + 1]]
+
+    def payload(self, idx):
+        """
+        Return a view of the payload of the frame at the given index.  For
+        IPv6 frames this is the IPv6 payload (extension headers and all),
+        otherwise it is everything after the Ethernet header.
+        """
+        start = self.payload_offset[idx]
+        return self._buffer[start:start + self.payload_length[idx]]
+
+    def to_numpy(self):
+        """
+        Return the columns as a dict of NumPy arrays.  The byte columns
+        are reshaped to (n, 6) and (n, 16) arrays of `uint8`.  Requires
+        NumPy to be installed.
+        """
+        import numpy
+
+        count = len(self)
+        columns = dict(
+                dest=numpy.frombuffer(self.dest, dtype=numpy.uint8)
+                    .reshape(count, 6),
+                source=numpy.frombuffer(self.source, dtype=numpy.uint8)
+                    .reshape(count, 6),
+                ip6_source=numpy.frombuffer(self.ip6_source,
+                    dtype=numpy.uint8).reshape(count, 16),
+                ip6_dest=numpy.frombuffer(self.ip6_dest,
+                    dtype=numpy.uint8).reshape(count, 16),
+        )
+        for name in ('ethertype', 'ip6', 'trafficclass', 'flowlabel',
+                'payload_len', 'next_header', 'hop_limit',
+                'payload_offset', 'payload_length'):
+            column = getattr(self, name)
+            columns[name] = numpy.frombuffer(column,
+                    dtype=numpy.dtype(column.typecode))
+        return columns
+
+
+def decodeframes(buffer, offsets, verify=False):
+    """
+    Decode a batch of raw frames held in one buffer (see `FrameBatch`) into
+    `EthernetFrame` objects.  This is a plain function taking a single
+    buffer so that a batch can be cheaply handed to a process pool.
+
+    Returns a list with one entry per frame, which is None for frames that
+    could not be decoded or that failed checksum verification (if `verify`
+    is set), and the number of frames that failed verification.
+    """
+    frames = []
+    rejected = 0
+    buffer = memoryview(buffer)
+
+    for idx in range(len(offsets) - 1):
+        framedata = buffer[offsets[idx]:offsets[idx + 1]]
+
+        if verify and (framedata[12:14] == b'\x86\xdd') \
+                and not IP6Datagram.verify(framedata[14:]):
+            rejected += 1
+            frames.append(None)
+            continue
+
+        try:
+            frames.append(EthernetFrame.parse(bytes(framedata)))
+        except:
+            frames.append(None)
+
+    return (frames, rejected)
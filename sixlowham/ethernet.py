@@ -2,25 +2,19 @@
 # vim: set tw=78 et sw=4 ts=4 sts=4 fileencoding=utf-8:
 # SPDX-License-Identifier: GPL-2.0
 
-import re
-import construct
-
-from .util import tobytes, checktypes
+from .util import tobytes, checktypes, importname, lazystruct
 
 
 class EthernetMACAddress(object):
     """
     A representation of a MAC (EUI-48) address.
     """
-    _STRUCT_ = construct.Array(6, construct.Byte)
-    _MAC_RE_ = re.compile(
-            r'^([0-9A-Fa-f]{2})([:-])'
-            r'([0-9A-Fa-f]{2})\2'
-            r'([0-9A-Fa-f]{2})\2'
-            r'([0-9A-Fa-f]{2})\2'
-            r'([0-9A-Fa-f]{2})\2'
-            r'([0-9A-Fa-f]{2})$'
-    )
+    @lazystruct
+    def _STRUCT_():
+        import construct
+        return construct.Array(6, construct.Byte)
+
+    _MAC_RE_ = None     # Compiled on first use
 
     def __init__(self, address):
         if isinstance(address, str):
@@ -35,6 +29,17 @@ class EthernetMACAddress(object):
 
     @classmethod
     def fromstr(cls, mac):
+        if cls._MAC_RE_ is None:
+            import re
+            EthernetMACAddress._MAC_RE_ = re.compile(
+                    r'^([0-9A-Fa-f]{2})([:-])'
+                    r'([0-9A-Fa-f]{2})\2'
+                    r'([0-9A-Fa-f]{2})\2'
+                    r'([0-9A-Fa-f]{2})\2'
+                    r'([0-9A-Fa-f]{2})\2'
+                    r'([0-9A-Fa-f]{2})$'
+            )
+
         match = cls._MAC_RE_.match(mac)
         if match is None:
             raise ValueError('%r does not match pattern' % mac)
@@ -70,12 +75,16 @@ class EthernetFrame(object):
     """
     A representation of an Ethernet frame.
     """
-    _STRUCT_ = construct.Struct(
-            "dest" / EthernetMACAddress._STRUCT_,
-            "source" / EthernetMACAddress._STRUCT_,
-            "proto" / construct.Int16ub,
-            "payload" / construct.GreedyBytes
-    )
+    @lazystruct
+    def _STRUCT_():
+        import construct
+        return construct.Struct(
+                "dest" / EthernetMACAddress._STRUCT_,
+                "source" / EthernetMACAddress._STRUCT_,
+                "proto" / construct.Int16ub,
+                "payload" / construct.GreedyBytes
+        )
+
     _KNOWN_PROTOCOLS_ = {}
 
     def __init__(self, dest, source, proto, payload):
@@ -95,8 +104,26 @@ class EthernetFrame(object):
         self._payload = payload
 
     @classmethod
-    def registerprotocol(cls, protocol):
-        cls._KNOWN_PROTOCOLS_[protocol._ETHERNET_PROTOCOL_] = protocol
+    def registerprotocol(cls, protocol, proto=None):
+        """
+        Register a protocol class.  To avoid importing the protocol's
+        module until a frame needs it, pass its name as a `module:class`
+        string along with its protocol number.
+        """
+        if proto is None:
+            proto = protocol._ETHERNET_PROTOCOL_
+        cls._KNOWN_PROTOCOLS_[proto] = protocol
+
+    @classmethod
+    def getprotocol(cls, proto):
+        """
+        Return the registered protocol class, importing it if need be.
+        """
+        protocol = cls._KNOWN_PROTOCOLS_.get(proto)
+        if isinstance(protocol, str):
+            protocol = importname(protocol)
+            cls._KNOWN_PROTOCOLS_[proto] = protocol
+        return protocol
 
     @classmethod
     def parse(cls, frame):
@@ -129,7 +156,7 @@ class EthernetFrame(object):
 
     @property
     def payload(self):
-        protocol = self._KNOWN_PROTOCOLS_.get(self.proto)
+        protocol = self.getprotocol(self.proto)
         if protocol is not None:
             return protocol.parse(self.rawpayload)
         else:
@@ -139,5 +166,9 @@ class EthernetFrame(object):
         return self._STRUCT_.build(dict(
             dest=bytes(self.dest),
             source=bytes(self.source),
-            proto=bytes(self.proto),
+            proto=self.proto,
             payload=self.rawpayload))
+
+
+# Register protocols, these get imported on first use.
+EthernetFrame.registerprotocol(__package__ + '.ip6:IP6Datagram', 0x86dd)
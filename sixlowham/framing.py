@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+# vim: set tw=78 et sw=4 ts=4 sts=4 fileencoding=utf-8:
+# SPDX-License-Identifier: GPL-2.0
+
+import struct
+
+from .ethernet import EthernetMACAddress
+from .util import lazystruct
+
+# Byte definitions
+SOH     = b'\x01'
+STX     = b'\x02'
+E_STX   = b'b'
+ETX     = b'\x03'
+E_ETX   = b'c'
+EOT     = b'\x04'
+ACK     = b'\x06'
+DLE     = b'\x10'
+E_DLE   = b'p'
+NAK     = b'\x15'
+SYN     = b'\x16'
+FS      = b'\x1c'
+
+# Agent capability flags, advertised in the SOH frame.  To select a
+# framing mode, the host ACKs the SOH frame with the flag appended.
+CAP_LENGTH_FRAMING = 0x01
+
+# Structure of SOH struct.  Older agents do not send the capability byte.
+@lazystruct
+def SOH_STRUCT():
+    import construct
+    return construct.Struct(
+            "mac" / EthernetMACAddress._STRUCT_,
+            "mtu" / construct.Int16ub,
+            "idx" / construct.Int32ub,
+            "name" / construct.PascalString(construct.Byte, "utf-8"),
+            "caps" / construct.Optional(construct.Byte)
+    )
+
+
+class StuffedFramer(object):
+    """
+    Byte-stuffed framing: each frame is wrapped in STX/ETX, and any STX,
+    ETX or DLE bytes within the frame are escaped with DLE.
+    """
+    def __init__(self):
+        self._buffer = b''
+
+    def encode(self, frame):
+        """
+        Apply byte stuffing and wrap the frame for sending.
+        """
+        frame = frame.replace(DLE, DLE + E_DLE)
+        frame = frame.replace(STX, DLE + E_STX)
+        frame = frame.replace(ETX, DLE + E_ETX)
+        return STX + frame + ETX
+
+    def decode(self, data):
+        """
+        Pull in the data received and return an iterator over the complete
+        frames.  Frames are decoded as the iterator is consumed, so if the
+        framing mode changes part-way through, stop iterating and `flush`
+        the remaining data into the new framer.
+        """
+        self._buffer += data
+        return self._frames()
+
+    def _frames(self):
+        framestart = self._buffer.find(STX)
+        while framestart >= 0:
+            frameend = self._buffer.find(ETX, framestart)
+            if frameend < 0:
+                break
+
+            frame = self._unstuff(self._buffer[framestart+1:frameend])
+            self._buffer = self._buffer[frameend+1:]
+            yield frame
+            framestart = self._buffer.find(STX)
+
+    @property
+    def buffered(self):
+        """
+        Return the number of bytes received but not yet decoded.
+        """
+        return len(self._buffer)
+
+    def flush(self):
+        """
+        Return and discard any data not yet decoded.
+        """
+        (data, self._buffer) = (self._buffer, b'')
+        return data
+
+    def _unstuff(self, rawframe):
+        """
+        Replace the byte-stuffing sequences and return it.
+        """
+        frame = rawframe.replace(DLE + E_STX, STX)
+        frame = frame.replace(DLE + E_ETX, ETX)
+        frame = frame.replace(DLE + E_DLE, DLE)
+        return frame
+
+
+class LengthFramer(object):
+    """
+    Length-prefixed framing: each frame is preceded by its length as a
+    16-bit big-endian integer.  The frame type byte follows as usual.
+    Nothing is escaped.
+
+    Received data is copied into a pre-allocated buffer, and frames are
+    sliced out of it once their full length has arrived.
+    """
+    _HEADER_ = struct.Struct('!H')
+
+    def __init__(self, bufsize=65536):
+        # The buffer must be able to hold the largest possible frame.
+        self._buffer = bytearray(max(bufsize, self._HEADER_.size + 0xffff))
+        self._view = memoryview(self._buffer)
+        self._used = 0
+
+    def encode(self, frame):
+        """
+        Prefix the frame with its length for sending.
+        """
+        return self._HEADER_.pack(len(frame)) + frame
+
+    def decode(self, data):
+        """
+        Pull in the data received and return a list of complete frames.
+        """
+        data = memoryview(data)
+        header_sz = self._HEADER_.size
+        pending = []
+
+        while len(data):
+            # Copy in as much as will fit
+            size = min(len(data), len(self._buffer) - self._used)
+            self._view[self._used:self._used+size] = data[:size]
+            self._used += size
+            data = data[size:]
+
+            # Slice out all the complete frames
+            start = 0
+            while (self._used - start) >= header_sz:
+                (length,) = self._HEADER_.unpack_from(self._buffer, start)
+                end = start + header_sz + length
+                if end > self._used:
+                    break
+
+                pending.append(bytes(self._view[start+header_sz:end]))
+                start = end
+
+            # Move the partial frame (if any) to the front.
+            if start:
+                self._buffer[0:self._used-start] = \
+                        self._buffer[start:self._used]
+                self._used -= start
+
+        return pending
+
+    @property
+    def buffered(self):
+        """
+        Return the number of bytes received but not yet decoded.
+        """
+        return self._used
+
+    def flush(self):
+        """
+        Return and discard any data not yet decoded.
+        """
+        data = bytes(self._view[:self._used])
+        self._used = 0
+        return data
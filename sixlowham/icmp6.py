@@ -2,33 +2,40 @@
 # vim: set tw=78 et sw=4 ts=4 sts=4 fileencoding=utf-8:
 # SPDX-License-Identifier: GPL-2.0
 
-import construct
 import weakref
 
 from .ip6 import IP6DatagramHeader, IP6Datagram, IP6Address
-from .rfc1071 import checksum
-from .util import tobytes, checktypes
+from .rfc1071 import checksum, onessum
+from .util import tobytes, checktypes, lazystruct
 
 class ICMP6Message(IP6DatagramHeader):
     """
     A representation of an ICMP message.
     """
     _HEADER_ID_ = 58
-    _STRUCT_ = construct.Struct(
-            "msgtype" / construct.Byte,
-            "msgcode" / construct.Byte,
-            "checksum" / construct.Int16ub,
-            "message" / construct.Array(8, construct.Byte),
-            "payload" / construct.GreedyBytes
-    )
-
-    _PSEUDOHEADER_ = construct.Struct(
-            "source" / IP6Address._STRUCT_,
-            "dest" / IP6Address._STRUCT_,
-            "length" / construct.Int32ub,
-            construct.Padding(3),
-            "next_header" / construct.Byte
-    )
+    _KNOWN_TYPES_ = {}
+
+    @lazystruct
+    def _STRUCT_():
+        import construct
+        return construct.Struct(
+                "msgtype" / construct.Byte,
+                "msgcode" / construct.Byte,
+                "checksum" / construct.Int16ub,
+                "message" / construct.Array(8, construct.Byte),
+                "payload" / construct.GreedyBytes
+        )
+
+    @lazystruct
+    def _PSEUDOHEADER_():
+        import construct
+        return construct.Struct(
+                "source" / IP6Address._STRUCT_,
+                "dest" / IP6Address._STRUCT_,
+                "length" / construct.Int32ub,
+                construct.Padding(3),
+                "next_header" / construct.Byte
+        )
 
     def __init__(self, msgtype, msgcode, message, payload):
         message = tobytes(message or b'')
@@ -69,6 +76,26 @@ class ICMP6Message(IP6DatagramHeader):
     def payload(self):
         return self._payload
 
+    @classmethod
+    def verify(cls, datagram, offset, length, dest=None):
+        """
+        Verify the checksum of the ICMPv6 message at `offset` in the raw
+        IPv6 `datagram`.  The pseudo-header is summed straight from the
+        datagram's source and destination address fields, or from `dest`
+        if given (the final destination if there is a routing header).
+        """
+        datagram = memoryview(datagram)
+        csum = (length >> 16) + (length & 0xffff) + cls._HEADER_ID_
+        if dest is None:
+            csum = onessum(datagram[8:40], csum)
+        else:
+            csum = onessum(dest, onessum(datagram[8:24], csum))
+        return onessum(datagram[offset:offset+length], csum) == 0xffff
+
+    @classmethod
+    def registertype(cls, msgclass):
+        cls._KNOWN_TYPES_[msgclass._MSGTYPE_] = msgclass
+
     @classmethod
     def parse(cls, payload, this_header=None):
         """
@@ -76,7 +103,8 @@ class ICMP6Message(IP6DatagramHeader):
         remaining payload data.
         """
         parsed = cls._STRUCT_.parse(payload)
-        header = cls(
+        msgclass = cls._KNOWN_TYPES_.get(parsed.msgtype, cls)
+        header = msgclass(
                 msgtype=parsed.msgtype,
                 msgcode=parsed.msgcode,
                 message=parsed.message,
@@ -91,8 +119,9 @@ class ICMP6Message(IP6DatagramHeader):
         # Computer the checksum
         checksum_val = checksum(self._PSEUDOHEADER_.build(dict(
             source=bytes(self.datagram.source),
-            dest=bytes(self.datagram.dest),
-            length=8 + len(payload)
+            dest=bytes(self.datagram.final_dest),
+            length=12 + len(payload),
+            next_header=self._HEADER_ID_
         )) + self._STRUCT_.build(dict(
             msgtype=self.msgtype,
             msgcode=self.msgcode,
@@ -111,6 +140,55 @@ class ICMP6Message(IP6DatagramHeader):
         ))
 
     def __repr__(self):
-        return '<ICMP6 %d.%d %r>' % (self.__class__.__name__,
+        return '<%s %d.%d %r>' % (self.__class__.__name__,
                 self.msgtype, self.msgcode, self.payload)
 IP6Datagram.registerprotocol(ICMP6Message)
+
+
+class MLDv2Report(ICMP6Message):
+    """
+    A Multicast Listener Report message (RFC 3810 section 5.2).
+    """
+    _MSGTYPE_ = 143
+
+    # Multicast address record types
+    MODE_IS_INCLUDE = 1
+    MODE_IS_EXCLUDE = 2
+    CHANGE_TO_INCLUDE_MODE = 3
+    CHANGE_TO_EXCLUDE_MODE = 4
+    ALLOW_NEW_SOURCES = 5
+    BLOCK_OLD_SOURCES = 6
+
+    @property
+    def records(self):
+        """
+        Return the multicast address records as a list of
+        `(record_type, address, sources)` tuples.
+        """
+        # The record count sits after two reserved bytes, the records
+        # follow straight after.
+        message = bytes(self.message)
+        count = (message[2] << 8) | message[3]
+        data = message[4:] + self.payload
+
+        records = []
+        offset = 0
+        for _ in range(count):
+            if (offset + 20) > len(data):
+                raise ValueError('Truncated multicast address record')
+
+            record_type = data[offset]
+            aux_len = data[offset + 1] * 4
+            num_sources = (data[offset + 2] << 8) | data[offset + 3]
+            address = IP6Address(data[offset+4:offset+20])
+            offset += 20
+
+            sources = [IP6Address(data[offset+(i*16):offset+((i+1)*16)])
+                    for i in range(num_sources)]
+            offset += (num_sources * 16) + aux_len
+            if offset > len(data):
+                raise ValueError('Truncated multicast address record')
+
+            records.append((record_type, address, sources))
+        return records
+ICMP6Message.registertype(MLDv2Report)
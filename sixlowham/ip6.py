@@ -2,22 +2,153 @@
 # vim: set tw=78 et sw=4 ts=4 sts=4 fileencoding=utf-8:
 # SPDX-License-Identifier: GPL-2.0
 
-import construct
 import ipaddress
 
-from .ethernet import EthernetFrame
-from .util import tobytes, checktypes
+from .ethernet import EthernetMACAddress, EthernetFrame
+from .util import tobytes, checktypes, importname, lazystruct
+
+# Extension header IDs
+HOP_BY_HOP_HEADER = 0
+ROUTING_HEADER = 43
+FRAGMENT_HEADER = 44
+DEST_OPTIONS_HEADER = 60
+
+# Extension headers that encode their length in 8-octet units, not counting
+# the first 8 octets.  The fragment header is always 8 octets long.
+_VARIABLE_EXTENSION_HEADERS_ = frozenset((
+    HOP_BY_HOP_HEADER, ROUTING_HEADER, DEST_OPTIONS_HEADER
+))
+
+# Fragment offset and M (more fragments) flag in a fragment header.  If
+# either is set, this is one piece of a larger datagram.
+_FRAGMENT_MASK_ = 0xfff9
+
+
+def walkheaders(payload, next_header, offset=0):
+    """
+    Walk the chain of headers in an IPv6 payload, starting at `offset` with
+    a header of type `next_header`.  Only the header lengths are inspected,
+    nothing is copied.  Returns a list of `(header_id, offset, length)`
+    tuples, one per header; the last entry is always the upper-layer
+    payload (which may be empty, e.g. for "no next header").
+
+    The walk ends at a fragment header if the datagram is fragmented, as
+    what follows is only part of the rest of the datagram.  The last entry
+    then covers the rest of the fragment; see `fragmented`.
+    """
+    end = len(payload)
+    index = []
+    while True:
+        if next_header in _VARIABLE_EXTENSION_HEADERS_:
+            if (end - offset) < 8:
+                raise ValueError('Truncated extension header %d at %d' \
+                        % (next_header, offset))
+            length = (payload[offset + 1] + 1) * 8
+        elif next_header == FRAGMENT_HEADER:
+            length = 8
+        else:
+            # Upper-layer protocol, this runs to the end of the payload.
+            index.append((next_header, offset, end - offset))
+            return index
+
+        if (offset + length) > end:
+            raise ValueError('Truncated extension header %d at %d' \
+                    % (next_header, offset))
+
+        index.append((next_header, offset, length))
+        if (next_header == FRAGMENT_HEADER) \
+                and (((payload[offset + 2] << 8) | payload[offset + 3])
+                        & _FRAGMENT_MASK_):
+            index.append((payload[offset], offset + length,
+                end - offset - length))
+            return index
+
+        next_header = payload[offset]
+        offset += length
+
+
+def fragmented(payload, index):
+    """
+    Return True if the header index from `walkheaders` over `payload` ended
+    at a fragment header, i.e. its last entry is a piece of a fragmented
+    datagram rather than a complete upper-layer payload.
+    """
+    if (len(index) < 2) or (index[-2][0] != FRAGMENT_HEADER):
+        return False
+    offset = index[-2][1]
+    return bool(((payload[offset + 2] << 8) | payload[offset + 3])
+            & _FRAGMENT_MASK_)
+
+
+def finaldestination(header, dest):
+    """
+    Return the final destination of a datagram from its routing `header`
+    (which must have segments left), given the destination `dest` in the
+    IPv6 header.  This is what upper-layer checksums are computed over (RFC
+    8200 section 8.1).  Returns None for routing types we don't know.
+    """
+    routing_type = header[2]
+    if routing_type in (0, 2):
+        # Type 0 (deprecated) and type 2 (Mobile IPv6) list full addresses
+        # after 4 reserved octets, the last is the final destination.
+        if len(header) < 24:
+            return None
+        return bytes(header[-16:])
+    elif routing_type == 3:
+        # RPL source route (RFC 6554): the last address has its first CmprE
+        # octets elided (they're the same as the current destination's)
+        # and is followed by Pad octets.
+        cmpre = header[4] & 0x0f
+        end = len(header) - (header[5] >> 4)
+        start = end - (16 - cmpre)
+        if start < 8:
+            return None
+        return bytes(dest[:cmpre]) + bytes(header[start:end])
+    return None
+
 
 class IP6Address(ipaddress.IPv6Address):
     """
     Representation of an IPv6 address.
     """
-    _STRUCT_ = construct.Array(16, construct.Byte)
+    @lazystruct
+    def _STRUCT_():
+        import construct
+        return construct.Array(16, construct.Byte)
 
     @classmethod
     def parse(cls, address):
         return cls(tobytes(address))
 
+    @classmethod
+    def fromeui48(cls, mac, prefix='fe80::'):
+        """
+        Derive an address in the given /64 prefix from a MAC address using
+        the modified EUI-64 interface identifier (RFC 4291 appendix A).
+        The default prefix gives the link-local address.
+        """
+        mac = bytes(mac)
+        return cls(ipaddress.IPv6Address(prefix).packed[:8]
+                + bytes([mac[0] ^ 0x02]) + mac[1:3]
+                + b'\xff\xfe' + mac[3:6])
+
+    @property
+    def solicitednode(self):
+        """
+        Return the solicited-node multicast address for this address
+        (RFC 4291 section 2.7.1).
+        """
+        return IP6Address(b'\xff\x02' + bytes(9) + b'\x01\xff'
+                + self.packed[13:])
+
+    @property
+    def multicastmac(self):
+        """
+        Return the Ethernet MAC address this multicast address maps to
+        (RFC 2464 section 7).
+        """
+        return EthernetMACAddress(b'\x33\x33' + self.packed[12:])
+
     def __bytes__(self):
         return self.packed
 
@@ -27,14 +158,17 @@ class IP6DatagramHeader(object):
     A representation of a single header.
     """
 
-    _STRUCT_ = construct.Struct(
-            "next_header" / construct.Byte,
-            "ext_len" / construct.Byte,
-            "payload" / construct.Array(
-                6 + (construct.this.ext_len * 8)
-            ),
-            "remainder" / construct.GreedyBytes
-    )
+    @lazystruct
+    def _STRUCT_():
+        import construct
+        return construct.Struct(
+                "next_header" / construct.Byte,
+                "ext_len" / construct.Byte,
+                "payload" / construct.Bytes(
+                    6 + (construct.this.ext_len * 8)
+                ),
+                "remainder" / construct.GreedyBytes
+        )
 
     def __init__(self, this_header, payload):
         self._this_header = this_header
@@ -53,6 +187,16 @@ class IP6DatagramHeader(object):
         header = cls(this_header=this_header, payload=parsed.payload)
         return (header, parsed.next_header, parsed.remainder)
 
+    @classmethod
+    def verify(cls, datagram, offset, length, dest=None):
+        """
+        Verify the integrity of this header at `offset` in the raw IPv6
+        `datagram`.  `dest` is the final destination for the pseudo-header,
+        if not the datagram's destination.  Headers without a checksum are
+        always valid.
+        """
+        return True
+
     @property
     def this_header(self):
         return self._this_header
@@ -76,36 +220,54 @@ class IP6DatagramHeader(object):
 
     def __repr__(self):
         return '<%s %d %r>' % (self.__class__.__name__,
-                self.next_header, self.payload)
+                self.this_header, self.payload)
+
 
 class GenericIP6DatagramHeader(IP6DatagramHeader):
     """
     A datagram header that follows the standard pattern.
     """
     def __init__(self, payload):
-        super(IP6DatagramHeader, self).__init__(
+        super(GenericIP6DatagramHeader, self).__init__(
                 self._HEADER_ID_, payload)
 
 
+class RawIP6Payload(IP6DatagramHeader):
+    """
+    An upper-layer payload of a protocol we don't know how to decode.
+    """
+    @classmethod
+    def parse(cls, payload, this_header=None):
+        return (cls(this_header=this_header, payload=payload), None, None)
+
+    def dump(self, next_header=None):
+        return self.payload
+
+
 class IP6Datagram(object):
     """
     A representation of an IPv6 datagram.
     """
     _ETHERNET_PROTOCOL_ = 0x86dd
-    _STRUCT_ = construct.Struct(
-            "header" / construct.BitStruct(
-                "version" / construct.BitsInteger(4),
-                "trafficclass" / construct.BitsInteger(8),
-                "flowlabel" / construct.BitsInteger(20)
-            ),
-            "payload_len" / construct.Int16ub,
-            "next_header" / construct.Byte,
-            "hop_limit" / construct.Byte,
-            "source" / IP6Address._STRUCT_,
-            "dest" / IP6Address._STRUCT_,
-            # This will be more headers, then eventually the payload itself.
-            "remainder" / construct.GreedyBytes,
-    )
+
+    @lazystruct
+    def _STRUCT_():
+        import construct
+        return construct.Struct(
+                "header" / construct.BitStruct(
+                    "version" / construct.BitsInteger(4),
+                    "trafficclass" / construct.BitsInteger(8),
+                    "flowlabel" / construct.BitsInteger(20)
+                ),
+                "payload_len" / construct.Int16ub,
+                "next_header" / construct.Byte,
+                "hop_limit" / construct.Byte,
+                "source" / IP6Address._STRUCT_,
+                "dest" / IP6Address._STRUCT_,
+                # This will be more headers, then eventually the payload
+                # itself.
+                "remainder" / construct.GreedyBytes,
+        )
 
     _KNOWN_PROTOCOLS_ = {}
 
@@ -126,14 +288,77 @@ class IP6Datagram(object):
         self._dest = dest
 
     @classmethod
-    def registerprotocol(cls, protocol):
-        cls._KNOWN_PROTOCOLS_[protocol._ETHERNET_PROTOCOL_] = protocol
+    def registerprotocol(cls, protocol, header_id=None):
+        """
+        Register a protocol class.  To avoid importing the protocol's
+        module until a datagram needs it, pass its name as a
+        `module:class` string along with its header ID.
+        """
+        if header_id is None:
+            header_id = protocol._HEADER_ID_
+        cls._KNOWN_PROTOCOLS_[header_id] = protocol
+
+    @classmethod
+    def getprotocol(cls, header_id):
+        """
+        Return the registered protocol class, importing it if need be.
+        """
+        protocol = cls._KNOWN_PROTOCOLS_.get(header_id)
+        if isinstance(protocol, str):
+            protocol = importname(protocol)
+            cls._KNOWN_PROTOCOLS_[header_id] = protocol
+        return protocol
+
+    @classmethod
+    def verify(cls, datagram):
+        """
+        Verify the checksums of the upper-layer protocol in the raw
+        datagram bytes, without decoding the datagram.  Returns False if
+        the datagram is malformed or a checksum does not match.
+        """
+        datagram = memoryview(datagram)
+        if (len(datagram) < 40) or ((datagram[0] >> 4) != 6):
+            return False
+
+        end = 40 + ((datagram[4] << 8) | datagram[5])
+        if end > len(datagram):
+            return False
+
+        try:
+            index = walkheaders(datagram[:end], datagram[6], 40)
+        except ValueError:
+            return False
+
+        # Checksums cover the whole upper-layer message, which we don't
+        # have until the datagram is reassembled.
+        if fragmented(datagram, index):
+            return True
+
+        dest = datagram[24:40]
+        for (this_header, offset, length) in index:
+            if (this_header == ROUTING_HEADER) and datagram[offset + 3]:
+                dest = finaldestination(datagram[offset:offset+length], dest)
+                if dest is None:
+                    # Can't tell what the checksum should cover.
+                    return True
+
+        for (this_header, offset, length) in index:
+            protocol = cls.getprotocol(this_header)
+            if (protocol is not None) and \
+                    not protocol.verify(datagram, offset, length, dest):
+                return False
+
+        return True
 
     @classmethod
-    def parse(cls, datagram):
+    def parse(cls, datagram, verify=False):
         """
-        Parse from raw datagram bytes.
+        Parse from raw datagram bytes.  If `verify` is set, checksums are
+        checked first and `ValueError` is raised on a mismatch.
         """
+        if verify and not cls.verify(datagram):
+            raise ValueError('IPv6 datagram failed verification')
+
         datagram_header = cls._STRUCT_.parse(datagram)
         if datagram_header.header.version != 6:
             raise ValueError('This is not an IPv6 datagram')
@@ -141,23 +366,33 @@ class IP6Datagram(object):
         ip6datagram = cls(
                 trafficclass=datagram_header.header.trafficclass,
                 flowlabel=datagram_header.header.flowlabel,
-                source=IP6Address(datagram_header.source),
-                dest=IP6Address(datagram_header.dest),
-                hop_limit=datagram_header.hop_limit,
-                next_header=datagram_header.next_header
+                source=IP6Address.parse(datagram_header.source),
+                dest=IP6Address.parse(datagram_header.dest),
+                hop_limit=datagram_header.hop_limit
         )
 
-        payload = datagram_header.remainder
-        next_header = datagram_header.next_header
-        while (payload is not None) and (next_header is not None) \
-                and len(payload):
-            protocol = cls._KNOWN_PROTOCOLS_.get(next_header)
-            if protocol is not None:
-                (header, next_header, payload) = protocol.parse(payload)
+        payload = memoryview(datagram_header.remainder)[
+                :datagram_header.payload_len]
+        index = walkheaders(payload, datagram_header.next_header)
+        partial = fragmented(payload, index)
+        for (position, (this_header, offset, length)) in enumerate(index):
+            if partial and (position == (len(index) - 1)):
+                # Only part of the payload, we can't decode it.
+                protocol = RawIP6Payload
             else:
-                (header, next_header, payload) = IP6DatagramHeader.parse(
-                        next_header, payload)
-                ip6datagram.append_header(header)
+                protocol = cls.getprotocol(this_header)
+
+            if protocol is None:
+                if (this_header in _VARIABLE_EXTENSION_HEADERS_) \
+                        or (this_header == FRAGMENT_HEADER):
+                    protocol = IP6DatagramHeader
+                else:
+                    protocol = RawIP6Payload
+
+            (header, _, _) = protocol.parse(
+                    bytes(payload[offset:offset+length]),
+                    this_header=this_header)
+            ip6datagram.append_header(header)
 
         return ip6datagram
 
@@ -174,6 +409,18 @@ class IP6Datagram(object):
 
         self._headers.append(header)
 
+    @property
+    def trafficclass(self):
+        return self._trafficclass
+
+    @property
+    def flowlabel(self):
+        return self._flowlabel
+
+    @property
+    def hop_limit(self):
+        return self._hop_limit
+
     @property
     def dest(self):
         return self._dest
@@ -182,6 +429,20 @@ class IP6Datagram(object):
     def source(self):
         return self._source
 
+    @property
+    def final_dest(self):
+        """
+        Return the final destination of the datagram: the destination,
+        unless a routing header (of a type we know) has segments left.
+        """
+        dest = bytes(self.dest)
+        for header in self._headers:
+            if (header.this_header == ROUTING_HEADER) and header.payload[1]:
+                final = finaldestination(bytes(2) + header.payload, dest)
+                if final is not None:
+                    dest = final
+        return IP6Address(dest)
+
     @property
     def headers(self):
         return self._headers
@@ -220,22 +481,16 @@ class IP6Datagram(object):
         ))
 
 
-class NoNextHeader(IP6DatagramHeader):
+class NoNextHeader(RawIP6Payload):
     """
     A header that says "no next header" (ironic I know)
     """
     _HEADER_ID_ = 59
 
-    def __init__(self, payload):
-        super(NoNextHeader, self).__init__(self._HEADER_ID, payload)
-
-    @classmethod
-    def parse(cls, payload, this_header=None):
-        return (cls(payload=payload), None, None)
-
-    def dump(self, next_header=None):
-        return self.payload
+    def __init__(self, payload, this_header=None):
+        super(NoNextHeader, self).__init__(self._HEADER_ID_, payload)
 IP6Datagram.registerprotocol(NoNextHeader)
+IP6Datagram.registerprotocol(__package__ + '.icmp6:ICMP6Message', 58)
 
 
 # Register IP6Datagram with EthernetFrame.
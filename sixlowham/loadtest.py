@@ -0,0 +1,363 @@
+#!/usr/bin/env python3
+# vim: set tw=78 et sw=4 ts=4 sts=4 fileencoding=utf-8:
+# SPDX-License-Identifier: GPL-2.0
+
+import argparse
+import asyncio
+import logging
+import math
+import os
+import random
+import struct
+import sys
+import time
+import tracemalloc
+
+from .agent import SixLowHAMAgent, FRAMING_STUFFED, FRAMING_LENGTH
+
+# Test frames use the IEEE local experimental ethertype, and carry a
+# sequence number at the start of the payload.
+_LOADTEST_ETHERTYPE_ = 0x88b5
+_SEQUENCE_ = struct.Struct('!Q')
+_DEST_MAC_ = b'\x02\x00\x00\x00\x00\xfe'
+
+
+class LatencyHistogram(object):
+    """
+    A histogram of latencies with logarithmically spaced buckets, so that
+    percentiles can be reported to within about 1% without keeping every
+    sample over a long run.
+    """
+    _RESOLUTION_ = math.log(1.02)
+    _MINIMUM_ = 1e-6
+
+    def __init__(self):
+        self._buckets = {}
+        self._count = 0
+        self._max = 0.0
+
+    def __len__(self):
+        return self._count
+
+    @property
+    def max(self):
+        return self._max
+
+    def add(self, latency):
+        bucket = int(math.log(max(latency, self._MINIMUM_)
+            / self._MINIMUM_) / self._RESOLUTION_)
+        self._buckets[bucket] = self._buckets.get(bucket, 0) + 1
+        self._count += 1
+        self._max = max(self._max, latency)
+
+    def percentile(self, percent):
+        """
+        Return the latency below which the given percentage of samples
+        fall, or None if there are no samples.
+        """
+        if not self._count:
+            return None
+
+        threshold = self._count * percent / 100.0
+        seen = 0
+        for bucket in sorted(self._buckets):
+            seen += self._buckets[bucket]
+            if seen >= threshold:
+                return min(self._MINIMUM_ * math.exp(
+                    (bucket + 1) * self._RESOLUTION_), self._max)
+        return self._max
+
+
+class LoadTest(object):
+    """
+    Drive a `SixLowHAMAgent` at a fixed frame rate, sampling memory use and
+    queue lengths over time and recording latencies from enqueue to ACK and
+    from receipt to the `receivedframe` signal.  The first sample, taken
+    once `warmup` seconds have passed, is the baseline for memory growth.
+    Queue peaks are tracked as frames are sent and received, not just when
+    sampling.
+    """
+    def __init__(self, agent, rate, sizes, duration, sample_interval,
+            warmup, use_tracemalloc, log):
+        if duration <= warmup:
+            raise ValueError('duration must be longer than the warmup')
+
+        self._agent = agent
+        self._rate = rate
+        self._sizes = sizes
+        self._duration = duration
+        self._sample_interval = sample_interval
+        self._warmup = warmup
+        self._use_tracemalloc = use_tracemalloc
+        self._log = log
+        self._random = random.Random(0)
+
+        self.tx_latency = LatencyHistogram()
+        self.rx_latency = LatencyHistogram()
+        self.samples = []
+        self.peaks = dict(tx_queued=0, rx_buffered=0)
+        self.sent = 0
+        self.acked = 0
+        self.received = 0
+
+        agent.sentframe.connect(self._on_sent)
+        agent.receivedframe.connect(self._on_received)
+
+    async def run(self):
+        if self._use_tracemalloc:
+            tracemalloc.start()
+
+        connected = asyncio.get_running_loop().create_future()
+        def _on_connected(**kwargs):
+            if not connected.done():
+                connected.set_result(None)
+        self._agent.connected.connect(_on_connected)
+
+        async with self._agent:
+            await asyncio.wait_for(connected, 30)
+            sampler = asyncio.get_running_loop().create_task(self._sample())
+            try:
+                await self._generate()
+            finally:
+                sampler.cancel()
+
+            # Let the queue drain before we stop.
+            deadline = time.monotonic() + 10
+            while self._agent.tx_queued and (time.monotonic() < deadline):
+                await asyncio.sleep(0.1)
+            self._take_sample()
+
+        if self._use_tracemalloc:
+            tracemalloc.stop()
+
+    async def _generate(self):
+        """
+        Enqueue frames at the configured rate until the time is up.
+        """
+        start = time.monotonic()
+        interval = 1.0 / self._rate
+        while True:
+            now = time.monotonic()
+            if (now - start) >= self._duration:
+                return
+
+            # Catch up on any frames we're behind on.
+            due = int((now - start) * self._rate) + 1
+            while self.sent < due:
+                self._send()
+            await asyncio.sleep(max(0, start + (due * interval)
+                - time.monotonic()))
+
+    def _send(self):
+        size = self._random.choice(self._sizes)
+        payload = _SEQUENCE_.pack(self.sent)
+        payload += bytes(max(0, size - len(payload)))
+        self._agent.send_ethernet_frame(_DEST_MAC_
+                + bytes(self._agent.if_mac)
+                + struct.pack('!H', _LOADTEST_ETHERTYPE_) + payload)
+        self.sent += 1
+        self._update_peaks()
+
+    def _on_sent(self, frame, latency, **kwargs):
+        self.acked += 1
+        self.tx_latency.add(latency)
+
+    def _on_received(self, frame, rxtime, **kwargs):
+        self._update_peaks()
+        if frame.proto != _LOADTEST_ETHERTYPE_:
+            return
+        self.received += 1
+        self.rx_latency.add(time.monotonic() - rxtime)
+
+    def _update_peaks(self):
+        self.peaks['tx_queued'] = max(self.peaks['tx_queued'],
+                self._agent.tx_queued)
+        self.peaks['rx_buffered'] = max(self.peaks['rx_buffered'],
+                self._agent.rx_buffered)
+
+    async def _sample(self):
+        await asyncio.sleep(self._warmup)
+        while True:
+            self._take_sample()
+            await asyncio.sleep(self._sample_interval)
+
+    def _take_sample(self):
+        if self._use_tracemalloc:
+            (traced, _) = tracemalloc.get_traced_memory()
+        else:
+            traced = None
+
+        sample = dict(time=time.monotonic(), rss=getrss(), traced=traced,
+                tx_queued=self._agent.tx_queued,
+                rx_buffered=self._agent.rx_buffered,
+                sent=self.sent, acked=self.acked, received=self.received)
+        self.samples.append(sample)
+        self._update_peaks()
+        if self._log is not None:
+            self._log.info('rss=%s traced=%s tx_queued=%d rx_buffered=%d '
+                    'sent=%d acked=%d received=%d', sample['rss'],
+                    sample['traced'], sample['tx_queued'],
+                    sample['rx_buffered'], sample['sent'],
+                    sample['acked'], sample['received'])
+
+
+def getrss():
+    """
+    Return the resident set size of this process in bytes, or None if it
+    can't be determined.
+    """
+    try:
+        with open('/proc/self/statm', 'r') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGESIZE')
+    except (OSError, ValueError):
+        pass
+
+    try:
+        import resource
+        # Peak, not current, but that's what's available.  Linux reports
+        # kiB, macOS reports bytes.
+        maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return maxrss if sys.platform == 'darwin' else maxrss * 1024
+    except ImportError:
+        return None
+
+
+def parsesizes(sizes):
+    """
+    Parse a frame size distribution: a comma-separated list of sizes,
+    each optionally weighted as `size*weight`, or a `min-max` range.
+    """
+    if '-' in sizes:
+        (minsize, maxsize) = sizes.split('-', 1)
+        return list(range(int(minsize), int(maxsize) + 1))
+
+    result = []
+    for size in sizes.split(','):
+        (size, _, weight) = size.partition('*')
+        result += [int(size)] * int(weight or 1)
+    return result
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(
+            description='Soak and load test SixLowHAMAgent')
+    parser.add_argument('--agent', default=None,
+            help='Agent to test (default: the stand-in agent)')
+    parser.add_argument('--framing', default=FRAMING_STUFFED,
+            choices=(FRAMING_STUFFED, FRAMING_LENGTH),
+            help='Framing mode to request')
+    parser.add_argument('--duration', type=float, default=60.0,
+            help='Duration of the test in seconds')
+    parser.add_argument('--rate', type=float, default=100.0,
+            help='Frames to send per second')
+    parser.add_argument('--sizes', default='64,256,1024',
+            help='Payload sizes: a list like 64,256*3,1024 or a range '
+                'like 64-1280')
+    parser.add_argument('--loss-rate', type=float, default=0.0,
+            help='Fraction of frames the stand-in agent loses (stand-in '
+                'agent only)')
+    parser.add_argument('--nak-rate', type=float, default=0.0,
+            help='Fraction of frames the stand-in agent NAKs (stand-in '
+                'agent only)')
+    parser.add_argument('--sample-interval', type=float, default=10.0,
+            help='Seconds between memory and queue samples')
+    parser.add_argument('--warmup', type=float, default=5.0,
+            help='Seconds to wait before taking the baseline sample, must '
+                'be less than the duration')
+    parser.add_argument('--no-tracemalloc', dest='tracemalloc',
+            action='store_false',
+            help='Do not trace Python memory allocations')
+    parser.add_argument('--max-rss-growth', type=float, default=None,
+            help='Fail if RSS grows by more than this many MiB')
+    parser.add_argument('--max-traced-growth', type=float, default=None,
+            help='Fail if traced memory grows by more than this many MiB')
+    parser.add_argument('--max-tx-queued', type=int, default=None,
+            help='Fail if the TX queue ever exceeds this many frames')
+    parser.add_argument('--max-rx-buffered', type=int, default=None,
+            help='Fail if the deframer buffer ever exceeds this many bytes')
+    parser.add_argument('--max-tx-p99', type=float, default=None,
+            help='Fail if p99 enqueue to ACK latency exceeds this many ms')
+    parser.add_argument('--max-rx-p99', type=float, default=None,
+            help='Fail if p99 receive to emit latency exceeds this many ms')
+    parser.add_argument('--verbose', action='store_true',
+            help='Log samples as they are taken')
+    args = parser.parse_args(args)
+
+    if (args.agent is not None) and (args.loss_rate or args.nak_rate):
+        parser.error('--loss-rate and --nak-rate only apply to the '
+                'stand-in agent, not --agent')
+    if args.duration <= args.warmup:
+        parser.error('--duration must be longer than --warmup')
+
+    logging.basicConfig(level=logging.INFO if args.verbose
+            else logging.WARNING)
+    log = logging.getLogger('sixlowham.loadtest')
+
+    if args.agent is None:
+        agent = SixLowHAMAgent(agent_path=sys.executable,
+                agent_args=['-m', 'sixlowham.standin', '--loopback',
+                    '--loss-rate', str(args.loss_rate),
+                    '--nak-rate', str(args.nak_rate), '--seed', '0'],
+                framing=args.framing)
+    else:
+        agent = SixLowHAMAgent(agent_path=args.agent, framing=args.framing)
+
+    test = LoadTest(agent, rate=args.rate, sizes=parsesizes(args.sizes),
+            duration=args.duration, sample_interval=args.sample_interval,
+            warmup=args.warmup, use_tracemalloc=args.tracemalloc, log=log)
+    asyncio.run(test.run())
+
+    # Report
+    print('frames: sent=%d acked=%d received=%d' \
+            % (test.sent, test.acked, test.received))
+    for (name, histogram) in (('enqueue to ACK', test.tx_latency),
+            ('receive to emit', test.rx_latency)):
+        if len(histogram):
+            print('%s latency (ms): p50=%.3f p99=%.3f p999=%.3f max=%.3f' \
+                    % ((name,) + tuple(histogram.percentile(p) * 1000.0
+                        for p in (50, 99, 99.9)) + (histogram.max * 1000.0,)))
+        else:
+            print('%s latency: no samples' % name)
+
+    failures = []
+    baseline = test.samples[0] if test.samples else None
+    final = test.samples[-1] if test.samples else None
+
+    def _growth(field):
+        if (baseline is None) or (baseline[field] is None) \
+                or (final[field] is None):
+            return None
+        return (final[field] - baseline[field]) / 1048576.0
+
+    for (field, limit) in (('rss', args.max_rss_growth),
+            ('traced', args.max_traced_growth)):
+        growth = _growth(field)
+        if growth is not None:
+            print('%s growth: %.3f MiB' % (field, growth))
+            if (limit is not None) and (growth > limit):
+                failures.append('%s grew by %.3f MiB (limit %.3f MiB)' \
+                        % (field, growth, limit))
+
+    for (field, limit) in (('tx_queued', args.max_tx_queued),
+            ('rx_buffered', args.max_rx_buffered)):
+        peak = test.peaks[field]
+        print('peak %s: %d' % (field, peak))
+        if (limit is not None) and (peak > limit):
+            failures.append('%s peaked at %d (limit %d)' \
+                    % (field, peak, limit))
+
+    for (name, histogram, limit) in (
+            ('enqueue to ACK', test.tx_latency, args.max_tx_p99),
+            ('receive to emit', test.rx_latency, args.max_rx_p99)):
+        if (limit is not None) and len(histogram) \
+                and ((histogram.percentile(99) * 1000.0) > limit):
+            failures.append('%s p99 latency %.3f ms (limit %.3f ms)' \
+                    % (name, histogram.percentile(99) * 1000.0, limit))
+
+    for failure in failures:
+        print('FAIL: %s' % failure)
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
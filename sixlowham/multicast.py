@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+# vim: set tw=78 et sw=4 ts=4 sts=4 fileencoding=utf-8:
+# SPDX-License-Identifier: GPL-2.0
+
+from .ip6 import IP6Address
+from .icmp6 import MLDv2Report
+
+# Well-known link-local multicast groups
+ALL_NODES = IP6Address('ff02::1')
+ALL_ROUTERS = IP6Address('ff02::2')
+ALL_MLDV2_ROUTERS = IP6Address('ff02::16')
+
+_BROADCAST_MAC_ = b'\xff' * 6
+
+
+class MulticastGroups(object):
+    """
+    A table of the IPv6 multicast groups an interface is listening to.
+    Groups come from two places: those joined because of our own address
+    configuration (which are reference counted), and those reported by
+    hosts on the interface in MLDv2 reports.  The table is compiled into a
+    set of Ethernet MAC addresses so that checking whether a frame should
+    be accepted is a single lookup.
+    """
+    def __init__(self):
+        self._joined = {}
+        self._reported = set()
+        self._macs = frozenset()
+
+    @property
+    def groups(self):
+        """
+        Return the set of groups currently being listened to.
+        """
+        return set(self._joined) | self._reported
+
+    def __contains__(self, group):
+        group = IP6Address(group)
+        return (group in self._joined) or (group in self._reported)
+
+    def join(self, group):
+        """
+        Join the given multicast group.
+        """
+        group = IP6Address(group)
+        if not group.is_multicast:
+            raise ValueError('%s is not a multicast address' % group)
+
+        self._joined[group] = self._joined.get(group, 0) + 1
+        if self._joined[group] == 1:
+            self._compile()
+
+    def leave(self, group):
+        """
+        Leave the given multicast group.  Groups stay joined until left as
+        many times as they were joined.
+        """
+        group = IP6Address(group)
+        count = self._joined.get(group, 0) - 1
+        if count > 0:
+            self._joined[group] = count
+        elif count == 0:
+            self._joined.pop(group)
+            self._compile()
+
+    def applyreport(self, report):
+        """
+        Update the reported groups from a MLDv2 report.
+        """
+        if not isinstance(report, MLDv2Report):
+            raise TypeError('report must be MLDv2Report not %s' \
+                    % type(report).__name__)
+
+        changed = False
+        for (record_type, group, sources) in report.records:
+            if record_type in (MLDv2Report.MODE_IS_EXCLUDE,
+                    MLDv2Report.CHANGE_TO_EXCLUDE_MODE):
+                listening = True
+            elif record_type in (MLDv2Report.MODE_IS_INCLUDE,
+                    MLDv2Report.CHANGE_TO_INCLUDE_MODE):
+                # Including no sources means not listening at all
+                listening = bool(sources)
+            elif record_type == MLDv2Report.ALLOW_NEW_SOURCES:
+                listening = True
+            else:
+                # Blocking sources doesn't change whether we listen
+                continue
+
+            if listening and (group not in self._reported):
+                self._reported.add(group)
+                changed = True
+            elif (not listening) and (group in self._reported):
+                self._reported.discard(group)
+                changed = True
+
+        if changed:
+            self._compile()
+
+    def accepts(self, mac):
+        """
+        Return True if a frame addressed to the given MAC address should be
+        accepted: unicast and broadcast frames always are, multicast frames
+        only if we listen to a group mapping to that address.
+        """
+        mac = bytes(mac)
+        return (not (mac[0] & 0x01)) or (mac in self._macs) \
+                or (mac == _BROADCAST_MAC_)
+
+    def _compile(self):
+        self._macs = frozenset(bytes(group.multicastmac)
+                for group in self.groups)
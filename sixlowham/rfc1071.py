@@ -3,6 +3,43 @@
 # SPDX-License-Identifier: GPL-2.0
 # Credit: https://github.com/mdelatorre/checksum/blob/master/ichecksum.py
 
+import sys
+
+def onessum(data, csum=0):
+    """
+    Compute the 16-bit one's complement sum of the supplied data, added to
+    `csum`.  The result is folded to 16 bits but not complemented, so sums
+    of several pieces of data (e.g. a pseudo-header and a message) can be
+    chained together.  A sum of 0xffff over data that includes its own
+    checksum field means the checksum is correct.
+
+    The data may be anything supporting the buffer protocol; slices of a
+    `memoryview` are summed without being copied.
+    """
+    data = memoryview(data).cast('B')
+    even = len(data) & ~1
+
+    # Sum the 16 bit words in native byte order.  The one's complement sum
+    # is byte order independent (RFC-1071 section 2B) so we only need to
+    # swap the folded result.
+    words = sum(data[:even].cast('H'))
+    while (words >> 16) > 0:
+        words = (words & 0xffff) + (words >> 16)
+    if sys.byteorder == 'little':
+        words = ((words << 8) & 0xff00) | (words >> 8)
+
+    csum += words
+    if even < len(data):
+        # Odd length, pad the last byte with zero.
+        csum += data[even] << 8
+
+    # take only 16 bits out of the 32 bit csum and add up the carries
+    while (csum >> 16) > 0:
+        csum = (csum & 0xffff) + (csum >> 16)
+
+    return csum
+
+
 def checksum(data, csum=0):
     """
     Compute the Internet Checksum of the supplied data.  The checksum is
@@ -11,20 +48,5 @@ def checksum(data, csum=0):
     in the checksum field of the packet and the data.  If the result is zero,
     then the checksum has not detected an error.
     """
-    # make 16 bit words out of every two adjacent 8 bit words in the packet
-    # and add them up
-    for i in range(0,len(data),2):
-        if i + 1 >= len(data):
-            csum += data[i] & 0xff
-        else:
-            w = ((data[i] << 8) & 0xff00) + (data[i+1] & 0xff)
-            csum += w
-
-    # take only 16 bits out of the 32 bit csum and add up the carries
-    while (csum >> 16) > 0:
-        csum = (csum & 0xffff) + (csum >> 16)
-
     # one's complement the result
-    csum = ~csum
-
-    return csum & 0xffff
+    return ~onessum(data, csum) & 0xffff
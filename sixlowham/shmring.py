@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+# vim: set tw=78 et sw=4 ts=4 sts=4 fileencoding=utf-8:
+# SPDX-License-Identifier: GPL-2.0
+
+import struct
+
+
+class FrameRingOverrun(Exception):
+    """
+    Raised by a reader that has fallen so far behind that frames it had
+    not yet read were overwritten.  `lost` is the number of frames missed;
+    the reader carries on from the oldest frame still in the ring.
+    """
+    def __init__(self, lost):
+        super(FrameRingOverrun, self).__init__(
+                '%d frames overwritten before being read' % lost)
+        self.lost = lost
+
+
+class FrameRing(object):
+    """
+    A single-producer, multi-consumer ring buffer of frames held in shared
+    memory.  The producer (e.g. `SixLowHAMAgent`) writes each frame into
+    the next slot along with its sequence number; consumers in other
+    processes attach to the ring by name and read frames as `memoryview`s
+    of the shared memory, without copying.
+
+    Readers never block the producer.  A reader that falls more than a
+    ring's worth of frames behind is told how many it missed (see
+    `FrameRingOverrun`).  As a slot may be overwritten while a reader is
+    looking at it, readers should call `valid` once done with a frame to
+    confirm what they read was not clobbered part-way through.
+
+    The shared memory consists of a 64-byte header followed by the slots.
+    Each slot holds the sequence number plus one of the frame in it (zero
+    whilst being written), the frame length, then the frame data.
+    Sequence numbers are stored as aligned native 64-bit words so that they
+    are written in one go.
+    """
+    _MAGIC_ = b'SLHR'
+    _HEADER_ = struct.Struct('=4sII')     # magic, slot count, slot size
+    _HEADER_SIZE_ = 64
+    _HEAD_WORD_ = 2                       # 64-bit word holding the head
+    _SLOT_HEADER_ = struct.Struct('=QI4x')    # sequence + 1, length
+
+    # Rings created by this process (or, after a fork, its parent)
+    _CREATED_ = set()
+
+    def __init__(self, shm, owner):
+        self._shm = shm
+        self._owner = owner
+
+        buf = shm.buf
+        if len(buf) < self._HEADER_SIZE_:
+            raise ValueError('%s is not a frame ring' % shm.name)
+        (magic, self._slot_count, self._slot_size) = \
+                self._HEADER_.unpack_from(buf, 0)
+        if magic != self._MAGIC_:
+            raise ValueError('%s is not a frame ring' % shm.name)
+
+        self._stride = self._SLOT_HEADER_.size + self._slot_size
+        self._words = buf.cast('Q')
+        self._next = self._words[self._HEAD_WORD_]
+
+    @classmethod
+    def create(cls, name=None, slot_count=1024, slot_size=1536):
+        """
+        Create a new ring in shared memory for writing.  The slot size is
+        the largest frame that can be stored, and is rounded up to a
+        multiple of 8 bytes.
+        """
+        from multiprocessing import shared_memory
+
+        slot_size = (slot_size + 7) & ~7
+        shm = shared_memory.SharedMemory(name=name, create=True,
+                size=cls._HEADER_SIZE_ + (slot_count
+                    * (cls._SLOT_HEADER_.size + slot_size)))
+        shm.buf[:cls._HEADER_SIZE_] = bytes(cls._HEADER_SIZE_)
+        cls._HEADER_.pack_into(shm.buf, 0,
+                cls._MAGIC_, slot_count, slot_size)
+        cls._CREATED_.add(shm.name)
+        return cls(shm, owner=True)
+
+    @classmethod
+    def attach(cls, name):
+        """
+        Attach to an existing ring for reading.  Reading starts with the
+        next frame written.
+        """
+        from multiprocessing import shared_memory
+
+        try:
+            shm = shared_memory.SharedMemory(name=name, track=False)
+        except TypeError:
+            # Before Python 3.13, attaching registers the segment with the
+            # resource tracker, which would remove it when we exit.  If we
+            # created it, that registration is the creator's, so leave it.
+            from multiprocessing import resource_tracker
+            shm = shared_memory.SharedMemory(name=name)
+            if shm.name not in cls._CREATED_:
+                resource_tracker.unregister(shm._name, 'shared_memory')
+
+        try:
+            return cls(shm, owner=False)
+        except:
+            # Not a ring, don't keep it mapped.
+            shm.close()
+            raise
+
+    @property
+    def name(self):
+        return self._shm.name
+
+    @property
+    def slot_count(self):
+        return self._slot_count
+
+    @property
+    def slot_size(self):
+        return self._slot_size
+
+    @property
+    def head(self):
+        """
+        Return the sequence number of the next frame to be written.
+        """
+        return self._words[self._HEAD_WORD_]
+
+    def _slot_offset(self, seq):
+        return self._HEADER_SIZE_ + ((seq % self._slot_count) * self._stride)
+
+    def write(self, frame):
+        """
+        Write a frame to the ring, returning its sequence number.
+        """
+        if len(frame) > self._slot_size:
+            raise ValueError('frame of %d bytes exceeds slot size %d' \
+                    % (len(frame), self._slot_size))
+
+        seq = self._words[self._HEAD_WORD_]
+        offset = self._slot_offset(seq)
+        seq_word = offset // 8
+
+        # Mark the slot as being written, fill it, then publish it.
+        self._words[seq_word] = 0
+        self._SLOT_HEADER_.pack_into(self._shm.buf, offset, 0, len(frame))
+        start = offset + self._SLOT_HEADER_.size
+        self._shm.buf[start:start+len(frame)] = frame
+        self._words[seq_word] = seq + 1
+        self._words[self._HEAD_WORD_] = seq + 1
+        return seq
+
+    def read(self):
+        """
+        Return the next frame as a `(sequence, memoryview)` tuple, or None
+        if there are no new frames.  Raises `FrameRingOverrun` if frames
+        were overwritten before we could read them; the next call carries
+        on from the oldest frame still in the ring.
+        """
+        head = self._words[self._HEAD_WORD_]
+        if self._next >= head:
+            return None
+
+        oldest = max(0, head - self._slot_count + 1)
+        if self._next < oldest:
+            lost = oldest - self._next
+            self._next = oldest
+            raise FrameRingOverrun(lost)
+
+        seq = self._next
+        offset = self._slot_offset(seq)
+        (slot_seq, length) = self._SLOT_HEADER_.unpack_from(
+                self._shm.buf, offset)
+        if slot_seq != (seq + 1):
+            # The producer has lapped us since we read the head.
+            lost = max(1, self._words[self._HEAD_WORD_]
+                    - self._slot_count + 1 - seq)
+            self._next = seq + lost
+            raise FrameRingOverrun(lost)
+
+        self._next = seq + 1
+        start = offset + self._SLOT_HEADER_.size
+        return (seq, self._shm.buf[start:start+length])
+
+    def valid(self, seq):
+        """
+        Return True if the frame with the given sequence number is still
+        in the ring, i.e. a view returned by `read` was not overwritten.
+        """
+        return self._words[self._slot_offset(seq) // 8] == (seq + 1)
+
+    def close(self):
+        """
+        Detach from the ring.  If we created it, it is also removed.  Any
+        views returned by `read` must be released first.
+        """
+        if self._words is None:
+            return
+
+        self._words.release()
+        self._words = None
+        self._shm.close()
+        if self._owner:
+            self._shm.unlink()
+            self._CREATED_.discard(self._shm.name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
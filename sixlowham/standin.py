@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+# vim: set tw=78 et sw=4 ts=4 sts=4 fileencoding=utf-8:
+# SPDX-License-Identifier: GPL-2.0
+
+import argparse
+import json
+import os
+import random
+import time
+
+from .ethernet import EthernetMACAddress
+from .framing import SOH, EOT, ACK, NAK, SYN, FS, SOH_STRUCT, \
+        CAP_LENGTH_FRAMING, StuffedFramer, LengthFramer
+
+
+class StandInAgent(object):
+    """
+    A stand-in for the 6LoWHAM agent that needs neither a TAP device nor a
+    radio.  It speaks the agent protocol on a pair of file descriptors
+    (stdin/stdout by default); Ethernet frames sent to it are ACKed, and in
+    loopback mode are sent straight back as received frames.  This is
+    intended for testing and benchmarking `SixLowHAMAgent`.
+
+    To simulate a poor link, a fraction of frames can be NAKed
+    (`nak_rate`), or ACKed but never looped back (`loss_rate`).  To simulate
+    an agent bug, it can be made to exit abruptly on receiving a frame with
+    a given ethertype (`crash_proto`).
+
+    The time the host takes to ACK or NAK each Ethernet frame we send it is
+    recorded in `ack_latency`, for benchmarking the host's receive path.
+    """
+    def __init__(self, if_name='sl0', if_mac=None, if_mtu=1280, if_idx=1,
+            length_framing=True, loopback=False, nak_rate=0.0,
+            loss_rate=0.0, crash_proto=None, seed=None, infd=0, outfd=1):
+        self._if_name = if_name
+        self._if_mac = if_mac or EthernetMACAddress('02:00:00:00:00:01')
+        self._if_mtu = if_mtu
+        self._if_idx = if_idx
+        self._length_framing = length_framing
+        self._loopback = loopback
+        self._nak_rate = nak_rate
+        self._loss_rate = loss_rate
+        self._crash_proto = crash_proto
+        self._random = random.Random(seed)
+        self._infd = infd
+        self._outfd = outfd
+
+        self._framer = StuffedFramer()
+        self._tx_buffer = []
+        self._frame_pending = False
+        self._sent_at = None
+        self.ack_latency = []
+
+    def run(self):
+        """
+        Run until EOT is received or stdin is closed.
+        """
+        self._tx_buffer.append(SOH + SOH_STRUCT.build(dict(
+            mac=list(bytes(self._if_mac)),
+            mtu=self._if_mtu,
+            idx=self._if_idx,
+            name=self._if_name,
+            caps=CAP_LENGTH_FRAMING if self._length_framing else None
+        )))
+        self._send_next()
+
+        while True:
+            data = os.read(self._infd, 65536)
+            if not data:
+                return
+
+            while data:
+                framer = self._framer
+                for frame in framer.decode(data):
+                    if not self._on_receive_frame(frame):
+                        return
+                    if framer is not self._framer:
+                        break
+
+                if framer is self._framer:
+                    break
+                data = framer.flush()
+
+            if not self._frame_pending:
+                self._send_next()
+
+    def _on_receive_frame(self, frame):
+        """
+        Handle a frame from the host.  Returns False if we should exit.
+        """
+        frametype = frame[0:1]
+        framedata = frame[1:]
+
+        if frametype == EOT:
+            return False
+
+        if frametype in (ACK, NAK):
+            if self._frame_pending:
+                self._frame_pending = False
+                if self._tx_buffer[0][0:1] == FS:
+                    self.ack_latency.append(
+                            time.monotonic() - self._sent_at)
+                if frametype == ACK:
+                    sent = self._tx_buffer.pop(0)
+                    if (sent[0:1] == SOH) and framedata \
+                            and (framedata[0] & CAP_LENGTH_FRAMING):
+                        # Host selected length-prefixed framing
+                        self._framer = LengthFramer()
+        elif frametype == FS:
+            if (self._crash_proto is not None) \
+                    and (framedata[12:14] == self._crash_proto.to_bytes(2,
+                        'big')):
+                os._exit(1)
+
+            if self._random.random() < self._nak_rate:
+                self._send_frame(NAK)
+                return True
+
+            self._send_frame(ACK)
+            if self._loopback \
+                    and (self._random.random() >= self._loss_rate):
+                self._tx_buffer.append(frame)
+        elif frametype == SYN:
+            self._send_frame(ACK)
+        else:
+            self._send_frame(NAK)
+
+        return True
+
+    def _send_next(self):
+        if self._tx_buffer:
+            self._send_frame(self._tx_buffer[0])
+            self._frame_pending = True
+            self._sent_at = time.monotonic()
+
+    def _send_frame(self, frame):
+        data = self._framer.encode(frame)
+        while data:
+            data = data[os.write(self._outfd, data):]
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(
+            description='Stand-in 6LoWHAM agent for testing')
+    parser.add_argument('-n', dest='if_name', default='sl0',
+            help='Interface name to report')
+    parser.add_argument('-a', dest='if_mac', default='02:00:00:00:00:01',
+            help='Interface MAC address to report')
+    parser.add_argument('-m', dest='if_mtu', type=int, default=1280,
+            help='Interface MTU to report')
+    parser.add_argument('--no-length-framing', dest='length_framing',
+            action='store_false',
+            help='Do not offer length-prefixed framing')
+    parser.add_argument('--loopback', action='store_true',
+            help='Send frames received back to the host')
+    parser.add_argument('--nak-rate', type=float, default=0.0,
+            help='Fraction of frames to NAK')
+    parser.add_argument('--loss-rate', type=float, default=0.0,
+            help='Fraction of frames to ACK but not loop back')
+    parser.add_argument('--crash-proto', type=lambda v: int(v, 0),
+            help='Exit abruptly on receiving a frame with this ethertype')
+    parser.add_argument('--seed', type=int,
+            help='Random seed for NAKs and losses')
+    parser.add_argument('--stats', metavar='FILE',
+            help='On exit, write the host ACK latencies to FILE as JSON')
+    args = parser.parse_args(args)
+
+    agent = StandInAgent(
+            if_name=args.if_name,
+            if_mac=EthernetMACAddress(args.if_mac),
+            if_mtu=args.if_mtu,
+            length_framing=args.length_framing,
+            loopback=args.loopback,
+            nak_rate=args.nak_rate,
+            loss_rate=args.loss_rate,
+            crash_proto=args.crash_proto,
+            seed=args.seed
+    )
+    agent.run()
+
+    if args.stats:
+        with open(args.stats, 'w') as stats:
+            json.dump(dict(ack_latency=agent.ack_latency), stats)
+
+
+if __name__ == '__main__':
+    main()
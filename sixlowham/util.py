@@ -2,6 +2,8 @@
 # vim: set tw=78 et sw=4 ts=4 sts=4 fileencoding=utf-8:
 # SPDX-License-Identifier: GPL-2.0
 
+import importlib
+
 def tobytes(data):
     """
     Coerce the given input to bytes if we can.  Input can be:
@@ -43,3 +45,45 @@ def checktypes(*values):
                         argtype.__name__
                         + (' or None' if optional else ''),
                         type(arg).__name__))
+
+
+def importname(name):
+    """
+    Import and return the object named by a `module:attribute` string.
+    """
+    (module, _, attribute) = name.partition(':')
+    return getattr(importlib.import_module(module), attribute)
+
+
+class lazystruct(object):
+    """
+    A `construct` definition that is only built (and compiled, where
+    `construct` can do so) the first time it is used, rather than when the
+    module is imported.  Decorate a function that returns the definition.
+
+    This may be used as a class attribute, or as a module-level object in
+    which case attribute access is passed through to the definition.
+    """
+    def __init__(self, builder):
+        self._builder = builder
+        self._struct = None
+
+    @property
+    def struct(self):
+        if self._struct is None:
+            struct = self._builder()
+            try:
+                struct = struct.compile()
+            except Exception:
+                # Not everything can be compiled, use it as it is.
+                pass
+            self._struct = struct
+        return self._struct
+
+    def __get__(self, instance, owner):
+        return self.struct
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return getattr(self.struct, name)
@@ -0,0 +1,357 @@
+# vim: set tw=78 et sw=4 ts=4 sts=4 fileencoding=utf-8:
+# SPDX-License-Identifier: GPL-2.0
+
+import asyncio
+import concurrent.futures
+import os
+import struct
+import sys
+
+import pytest
+
+from sixlowham.agent import SixLowHAMAgent
+from sixlowham.framing import StuffedFramer, LengthFramer
+from sixlowham.shmring import FrameRing
+
+from test_ip6 import echorequest, fragment
+
+_ROOT_ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+_CRASH_PROTO_ = 0x88b6
+_TEST_PROTO_ = 0x88b5
+
+
+@pytest.fixture(autouse=True)
+def standin_path(monkeypatch):
+    # The stand-in agent needs to find the package too.
+    monkeypatch.setenv('PYTHONPATH', _ROOT_)
+
+
+def standin(*args, **kwargs):
+    return SixLowHAMAgent(agent_path=sys.executable,
+            agent_args=['-m', 'sixlowham.standin'] + list(args), **kwargs)
+
+
+def frame(agent, proto):
+    return b'\x02\x00\x00\x00\x00\xfe' + bytes(agent.if_mac) \
+            + struct.pack('!H', proto) + bytes(32)
+
+
+def record(signal):
+    """
+    Collect the keyword arguments of each emission of a signal.
+    """
+    emitted = []
+    signal.connect(lambda **kwargs: emitted.append(kwargs))
+    return emitted
+
+
+async def until(condition, timeout=10):
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not condition():
+        assert asyncio.get_running_loop().time() < deadline, \
+                'timed out waiting for condition'
+        await asyncio.sleep(0.01)
+
+
+@pytest.mark.parametrize('during_spawn', [False, True])
+def test_stop_while_restarting(during_spawn):
+    async def run():
+        agent = standin(restart=True, restart_delay=0.01)
+        connected = record(agent.connected)
+
+        # Stop as soon as the restart is under way, either before the
+        # agent is launched or whilst it is being launched.
+        do_restart = agent._do_restart
+        def _do_restart():
+            do_restart()
+            assert agent._restart_task is not None
+            if during_spawn:
+                asyncio.get_running_loop().call_soon(agent.stop)
+            else:
+                agent.stop()
+        agent._do_restart = _do_restart
+
+        async with agent:
+            await until(lambda: connected)
+            agent._process.kill()
+            await asyncio.wait_for(agent.wait(), 10)
+
+        assert agent._process is None
+        await asyncio.sleep(0.5)
+        assert agent._process is None
+        if not during_spawn:
+            assert len(connected) == 1
+
+    asyncio.run(run())
+
+
+def test_stop_while_restart_pending():
+    async def run():
+        agent = standin(restart=True, restart_delay=10)
+        connected = record(agent.connected)
+        disconnected = record(agent.disconnected)
+        async with agent:
+            await until(lambda: connected)
+            agent._process.kill()
+            await until(lambda: disconnected)
+            # __aexit__ stops the agent and waits
+
+        assert agent._process is None
+        assert agent._restart_handle is None
+
+    asyncio.run(run())
+
+
+def test_started_on_new_loop():
+    agent = standin('--loopback')
+    connected = record(agent.connected)
+    received = record(agent.receivedframe)
+
+    async def run():
+        async with agent:
+            assert agent._loop is asyncio.get_running_loop()
+            await until(lambda: len(connected) == len(received) + 1)
+            agent.send_ethernet_frame(frame(agent, _TEST_PROTO_))
+            await until(lambda: len(received) == len(connected))
+        assert agent._loop is None
+
+    # Each run has a loop of its own.
+    asyncio.run(run())
+    asyncio.run(run())
+    assert len(received) == 2
+
+
+def test_started_on_wrong_loop():
+    loop = asyncio.new_event_loop()
+    try:
+        agent = standin(loop=loop)
+        with pytest.raises(RuntimeError):
+            asyncio.run(agent.start())
+        assert agent._loop is loop
+    finally:
+        loop.close()
+
+
+def test_crashing_frame_dropped():
+    async def run():
+        agent = standin('--crash-proto', hex(_CRASH_PROTO_),
+                restart=True, restart_delay=0.01, restart_delay_max=0.1,
+                tx_attempts=3)
+        connected = record(agent.connected)
+        sent = record(agent.sentframe)
+        async with agent:
+            await until(lambda: connected)
+            agent.send_ethernet_frame(frame(agent, _CRASH_PROTO_))
+            agent.send_ethernet_frame(frame(agent, _TEST_PROTO_))
+
+            # Three attempts, each taking the agent down, then the frame
+            # is dropped and the next one goes through.
+            await until(lambda: sent)
+            assert len(connected) == 4
+            assert [f['frame'][12:14] for f in sent] \
+                    == [struct.pack('!H', _TEST_PROTO_)]
+            assert agent.tx_queued == 0
+
+            # The backoff was not reset by the agent reconnecting.
+            assert agent._restart_delay == 0.08
+
+    asyncio.run(run())
+
+
+def test_backoff_reset_once_stable():
+    async def run():
+        agent = standin('--crash-proto', hex(_CRASH_PROTO_),
+                restart=True, restart_delay=0.01, restart_stable=0.2,
+                tx_attempts=2)
+        connected = record(agent.connected)
+        async with agent:
+            await until(lambda: connected)
+            agent.send_ethernet_frame(frame(agent, _CRASH_PROTO_))
+            await until(lambda: len(connected) == 3)
+            assert agent._restart_delay == 0.04
+
+            await asyncio.sleep(0.4)
+            assert agent._restart_delay == 0.01
+
+    asyncio.run(run())
+
+
+def test_decode_executor_shut_down():
+    async def run():
+        executor = concurrent.futures.ThreadPoolExecutor(1)
+        agent = standin('--loopback', decode_executor=executor)
+        connected = record(agent.connected)
+        received = record(agent.receivedframe)
+        async with agent:
+            await until(lambda: connected)
+            agent.send_ethernet_frame(frame(agent, _TEST_PROTO_))
+            await until(lambda: len(received) == 1)
+
+            # Frames keep coming, decoded on the event loop instead.
+            executor.shutdown()
+            for _ in range(5):
+                agent.send_ethernet_frame(frame(agent, _TEST_PROTO_))
+            await until(lambda: len(received) == 6)
+
+    asyncio.run(run())
+
+
+class CountingExecutor(concurrent.futures.ThreadPoolExecutor):
+    def __init__(self, *args, **kwargs):
+        super(CountingExecutor, self).__init__(*args, **kwargs)
+        self.batches = []
+
+    def submit(self, fn, buffer, offsets, *args):
+        self.batches.append(len(offsets) - 1)
+        return super(CountingExecutor, self).submit(
+                fn, buffer, offsets, *args)
+
+
+def test_decode_batches_span_reads():
+    async def run():
+        with CountingExecutor(1) as executor:
+            agent = standin('--loopback', decode_executor=executor,
+                    decode_batch_size=8, decode_batch_delay=0.5)
+            connected = record(agent.connected)
+            received = record(agent.receivedframe)
+            async with agent:
+                await until(lambda: connected)
+
+                # The agent sends these one at a time, waiting for each
+                # ACK, but they still get decoded together.
+                for _ in range(8):
+                    agent.send_ethernet_frame(frame(agent, _TEST_PROTO_))
+                await until(lambda: len(received) == 8)
+                assert executor.batches == [8]
+
+                # A partial batch goes once it has waited long enough.
+                loop = asyncio.get_running_loop()
+                start = loop.time()
+                for _ in range(3):
+                    agent.send_ethernet_frame(frame(agent, _TEST_PROTO_))
+                await until(lambda: len(received) == 11)
+                assert loop.time() - start >= 0.45
+                assert executor.batches == [8, 3]
+
+    asyncio.run(run())
+
+
+def test_ring_only_gets_acked_frames():
+    async def run():
+        with FrameRing.create(slot_count=64) as ring, \
+                FrameRing.attach(ring.name) as reader:
+            agent = standin('--loopback', ring=ring)
+            connected = record(agent.connected)
+            received = record(agent.receivedframe)
+            async with agent:
+                await until(lambda: connected)
+                good = frame(agent, _TEST_PROTO_)
+                agent.send_ethernet_frame(good)
+                await until(lambda: received)
+                assert ring.head == 1
+
+                # A runt is NAKed each time the agent sends it back, so
+                # should never reach the ring.
+                agent.send_ethernet_frame(good[:10])
+                await asyncio.sleep(0.2)
+                assert ring.head == 1
+
+            (seq, view) = reader.read()
+            assert (seq, bytes(view)) == (0, good)
+            view.release()
+
+    asyncio.run(run())
+
+
+def test_bad_checksum_rejected():
+    async def run():
+        agent = standin('--loopback', verify_checksums=True)
+        connected = record(agent.connected)
+        received = record(agent.receivedframe)
+        async with agent:
+            await until(lambda: connected)
+            header = frame(agent, 0x86dd)[:14]
+            good = echorequest()
+            bad = bytearray(good)
+            bad[-1] ^= 0x01
+            # Fragments can't be checked until reassembled, so get through.
+            pieces = fragment(good, 32)
+
+            for datagram in [good, bytes(bad)] + pieces:
+                agent.send_ethernet_frame(header + datagram)
+            await until(lambda: len(received) == 3)
+            await asyncio.sleep(0.2)
+
+            assert agent.rx_rejected == 1
+            assert [bytes(f['frame'])[14:] for f in received] \
+                    == [good] + pieces
+
+    asyncio.run(run())
+
+
+def test_baseline_positional_arguments():
+    agent = SixLowHAMAgent('6lhagent', 'tap0', None, 1280, 5)
+    assert agent.if_name == 'tap0'
+    assert (agent._if_mtu, agent._tx_attempts) == (1280, 5)
+    with pytest.raises(TypeError):
+        SixLowHAMAgent('6lhagent', 'tap0', None, 1280, 5, None, [])
+
+
+@pytest.mark.parametrize('args, framing, expected', [
+    ((), 'stuffed', StuffedFramer),
+    ((), 'length', LengthFramer),
+    # An agent that doesn't send the capability byte can't switch.
+    (('--no-length-framing',), 'length', StuffedFramer),
+])
+def test_loopback_framing(args, framing, expected):
+    async def run():
+        agent = standin('--loopback', *args, framing=framing)
+        connected = record(agent.connected)
+        received = record(agent.receivedframe)
+        async with agent:
+            await until(lambda: connected)
+            assert type(agent._protocol.framer) is expected
+
+            frames = [frame(agent, _TEST_PROTO_)[:14]
+                    + bytes(i & 0xff for i in range(n))
+                    for n in (1, 2, 3, 16, 100, 1000)]
+            for f in frames:
+                agent.send_ethernet_frame(f)
+            await until(lambda: len(received) == len(frames))
+            assert [bytes(f['frame']) for f in received] == frames
+
+    asyncio.run(run())
+
+
+@pytest.mark.parametrize('executor', [False, True])
+def test_ring_skips_bad_checksums(executor):
+    async def run():
+        with FrameRing.create(slot_count=64) as ring, \
+                FrameRing.attach(ring.name) as reader, \
+                concurrent.futures.ThreadPoolExecutor(1) as pool:
+            agent = standin('--loopback', ring=ring, verify_checksums=True,
+                    decode_executor=pool if executor else None)
+            connected = record(agent.connected)
+            received = record(agent.receivedframe)
+            async with agent:
+                await until(lambda: connected)
+                header = frame(agent, 0x86dd)[:14]
+                good = header + echorequest()
+                bad = bytearray(good)
+                bad[-1] ^= 0x01
+
+                for f in (good, bytes(bad), good):
+                    agent.send_ethernet_frame(f)
+                await until(lambda: len(received) == 2)
+                await asyncio.sleep(0.2)
+                assert agent.rx_rejected == 1
+
+            frames = []
+            for _ in range(ring.head):
+                (seq, view) = reader.read()
+                frames.append(bytes(view))
+                view.release()
+            assert frames == [good, good]
+
+    asyncio.run(run())
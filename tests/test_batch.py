@@ -0,0 +1,113 @@
+# vim: set tw=78 et sw=4 ts=4 sts=4 fileencoding=utf-8:
+# SPDX-License-Identifier: GPL-2.0
+
+import random
+import struct
+
+import pytest
+
+from sixlowham.batch import FrameBatch, _numpy
+from sixlowham.ethernet import EthernetFrame
+from sixlowham.ip6 import IP6Datagram
+
+COLUMNS = ('dest', 'source', 'ethertype', 'ip6', 'trafficclass',
+        'flowlabel', 'payload_len', 'next_header', 'hop_limit',
+        'ip6_source', 'ip6_dest', 'payload_offset', 'payload_length')
+
+DECODERS = [False, pytest.param(True, marks=pytest.mark.skipif(
+    not _numpy(), reason='NumPy is not installed'))]
+
+
+def ip6frame(rnd, payload_size=None, version=6):
+    if payload_size is None:
+        payload_size = rnd.randrange(0, 64)
+    payload = bytes(rnd.getrandbits(8) for _ in range(payload_size))
+    header = struct.pack('!LHBB16s16s',
+            (version << 28) | (rnd.getrandbits(8) << 20)
+                | rnd.getrandbits(20),
+            len(payload), 59, rnd.getrandbits(8),
+            bytes(rnd.getrandbits(8) for _ in range(16)),
+            bytes(rnd.getrandbits(8) for _ in range(16)))
+    return bytes(rnd.getrandbits(8) for _ in range(12)) + b'\x86\xdd' \
+            + header + payload
+
+
+def mixedframes(rnd, count):
+    """
+    Generate a mix of IPv6 frames, and frames the batch decoder must cope
+    with: runts, other ethertypes, truncated IPv6 headers, the wrong IP
+    version, and trailing padding after the IPv6 payload.
+    """
+    frames = []
+    for _ in range(count):
+        kind = rnd.randrange(6)
+        if kind == 0:
+            frames.append(bytes(rnd.randrange(14)))
+        elif kind == 1:
+            frames.append(bytes(12) + b'\x08\x00' + bytes(rnd.randrange(64)))
+        elif kind == 2:
+            frames.append(ip6frame(rnd)[:rnd.randrange(14, 54)])
+        elif kind == 3:
+            frames.append(ip6frame(rnd, version=4))
+        elif kind == 4:
+            frames.append(ip6frame(rnd) + bytes(rnd.randrange(1, 8)))
+        else:
+            frames.append(ip6frame(rnd))
+    return frames
+
+
+@pytest.mark.parametrize('use_numpy', DECODERS)
+def test_matches_per_object_parse(use_numpy):
+    rnd = random.Random(1)
+    frames = [ip6frame(rnd) for _ in range(200)]
+    batch = FrameBatch.fromframes(frames, use_numpy=use_numpy)
+
+    assert len(batch) == len(frames)
+    for (idx, raw) in enumerate(frames):
+        frame = EthernetFrame.parse(raw)
+        datagram = frame.payload
+        assert isinstance(datagram, IP6Datagram)
+        assert batch.dest[idx*6:(idx+1)*6] == bytes(frame.dest)
+        assert batch.source[idx*6:(idx+1)*6] == bytes(frame.source)
+        assert batch.ethertype[idx] == frame.proto
+        assert batch.ip6[idx] == 1
+        assert batch.trafficclass[idx] == datagram.trafficclass
+        assert batch.flowlabel[idx] == datagram.flowlabel
+        assert batch.hop_limit[idx] == datagram.hop_limit
+        assert batch.next_header[idx] == datagram.next_header
+        assert batch.ip6_source[idx*16:(idx+1)*16] == bytes(datagram.source)
+        assert batch.ip6_dest[idx*16:(idx+1)*16] == bytes(datagram.dest)
+        assert bytes(batch.payload(idx)) == raw[54:]
+
+
+@pytest.mark.skipif(not _numpy(), reason='NumPy is not installed')
+def test_numpy_matches_python():
+    rnd = random.Random(2)
+    frames = mixedframes(rnd, 1000)
+    python = FrameBatch.fromframes(frames, use_numpy=False)
+    numpy = FrameBatch.fromframes(frames, use_numpy=True)
+
+    for name in COLUMNS:
+        assert getattr(numpy, name) == getattr(python, name), name
+
+
+@pytest.mark.parametrize('use_numpy', DECODERS)
+def test_offsets_into_buffer(use_numpy):
+    rnd = random.Random(3)
+    frames = mixedframes(rnd, 50)
+    buffer = b'\xaa' * 5 + b''.join(frames)
+    offsets = [5]
+    for frame in frames:
+        offsets.append(offsets[-1] + len(frame))
+
+    batch = FrameBatch(buffer, offsets, use_numpy=use_numpy)
+    for (idx, frame) in enumerate(frames):
+        assert bytes(batch.frame(idx)) == frame
+        if len(frame) < 14:
+            assert batch.payload_length[idx] == 0
+
+
+@pytest.mark.parametrize('use_numpy', DECODERS)
+def test_empty(use_numpy):
+    batch = FrameBatch(b'', [0], use_numpy=use_numpy)
+    assert len(batch) == 0
@@ -0,0 +1,99 @@
+# vim: set tw=78 et sw=4 ts=4 sts=4 fileencoding=utf-8:
+# SPDX-License-Identifier: GPL-2.0
+
+import random
+
+from sixlowham.agent import SixLowHAMAgentProtocol
+from sixlowham.framing import SOH, FS, STX, ETX, DLE, StuffedFramer, \
+        LengthFramer
+
+
+def makeframes(rnd, count):
+    # Plenty of bytes that need stuffing, and the odd empty frame.
+    alphabet = STX + ETX + DLE + b'abc'
+    return [FS + bytes(rnd.choice(alphabet)
+        for _ in range(rnd.randrange(300))) for _ in range(count)]
+
+
+def chunks(rnd, data):
+    """
+    Split `data` into random sized pieces, from single bytes to several
+    frames' worth.
+    """
+    while data:
+        size = rnd.choice((1, 2, 3, rnd.randrange(1, 1024)))
+        yield data[:size]
+        data = data[size:]
+
+
+def test_length_partial_and_coalesced_reads():
+    for seed in range(20):
+        rnd = random.Random(seed)
+        frames = makeframes(rnd, 50)
+        framer = LengthFramer(bufsize=1024)
+        stream = b''.join(framer.encode(f) for f in frames)
+
+        decoded = []
+        for piece in chunks(rnd, stream):
+            decoded.extend(framer.decode(piece))
+        assert decoded == frames, seed
+        assert framer.buffered == 0
+
+
+def test_length_partial_frame_buffered():
+    framer = LengthFramer()
+    data = framer.encode(FS + b'hello')
+    assert framer.decode(data[:1]) == []
+    assert framer.decode(data[1:4]) == []
+    assert framer.buffered == 4
+    assert framer.decode(data[4:] + data[:3]) == [FS + b'hello']
+    assert framer.flush() == data[:3]
+    assert framer.buffered == 0
+
+
+def test_stuffed_partial_and_coalesced_reads():
+    for seed in range(20):
+        rnd = random.Random(seed)
+        frames = makeframes(rnd, 50)
+        framer = StuffedFramer()
+        stream = b''.join(framer.encode(f) for f in frames)
+
+        decoded = []
+        for piece in chunks(rnd, stream):
+            decoded.extend(framer.decode(piece))
+        assert decoded == frames, seed
+
+
+class FakeAgent(object):
+    """
+    Switches the protocol to length-prefixed framing on seeing SOH, like
+    SixLowHAMAgent does when the agent supports it.
+    """
+    def __init__(self):
+        self.protocol = SixLowHAMAgentProtocol(self)
+        self.frames = []
+
+    def _on_receive_frame(self, frame):
+        self.frames.append(frame)
+        if frame[:1] == SOH:
+            self.protocol.framer = LengthFramer()
+
+    def _report_frame_error(self, frame):
+        pass
+
+
+def test_framer_switch_mid_chunk():
+    rnd = random.Random(0)
+    frames = makeframes(rnd, 10)
+    stuffed = StuffedFramer().encode(SOH + b'ifdata')
+    length = b''.join(LengthFramer().encode(f) for f in frames)
+
+    # The length-prefixed frames arrive in the same read as the SOH frame,
+    # with the last one split across into the next read.
+    agent = FakeAgent()
+    agent.protocol.data_received(stuffed + length[:-5])
+    agent.protocol.data_received(length[-5:])
+
+    assert agent.frames == [SOH + b'ifdata'] + frames
+    assert type(agent.protocol.framer) is LengthFramer
+    assert agent.protocol.framer.buffered == 0
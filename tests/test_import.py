@@ -0,0 +1,55 @@
+# vim: set tw=78 et sw=4 ts=4 sts=4 fileencoding=utf-8:
+# SPDX-License-Identifier: GPL-2.0
+
+import os
+import subprocess
+import sys
+
+import pytest
+
+_ROOT_ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Cumulative import time budgets in microseconds, as reported by
+# `-X importtime`.  Importing construct alone takes around 80 ms.
+BUDGETS = {
+    'sixlowham.ethernet':   20000,
+    'sixlowham.ip6':        40000,
+    'sixlowham.icmp6':      40000,
+    'sixlowham.framing':    20000,
+}
+
+# Best of this many runs is compared against the budget
+RUNS = 3
+
+
+def importtime(module):
+    """
+    Import a module in a fresh interpreter.  Returns its cumulative import
+    time in microseconds, and the names of the modules it left loaded.
+    """
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c',
+        'import sys, %s; print(" ".join(sys.modules))' % module],
+        cwd=_ROOT_, capture_output=True, text=True, check=True)
+
+    cumulative = None
+    for line in result.stderr.splitlines():
+        fields = [f.strip() for f in line.split('|')]
+        if (len(fields) == 3) and (fields[2] == module):
+            cumulative = int(fields[1])
+    assert cumulative is not None, result.stderr
+    return (cumulative, set(result.stdout.split()))
+
+
+@pytest.mark.parametrize('module', sorted(BUDGETS))
+def test_import_defers_construct(module):
+    (_, modules) = importtime(module)
+    assert 'construct' not in modules
+    assert 'signalslot' not in modules
+
+
+@pytest.mark.parametrize('module', sorted(BUDGETS))
+def test_import_budget(module):
+    elapsed = min(importtime(module)[0] for _ in range(RUNS))
+    assert elapsed <= BUDGETS[module], \
+            '%s took %d us to import, budget is %d us' \
+            % (module, elapsed, BUDGETS[module])
@@ -0,0 +1,308 @@
+# vim: set tw=78 et sw=4 ts=4 sts=4 fileencoding=utf-8:
+# SPDX-License-Identifier: GPL-2.0
+
+import random
+import struct
+
+import pytest
+
+from sixlowham.ip6 import walkheaders, fragmented, IP6Datagram, \
+        IP6DatagramHeader, RawIP6Payload, NoNextHeader, HOP_BY_HOP_HEADER, \
+        ROUTING_HEADER, FRAGMENT_HEADER, DEST_OPTIONS_HEADER
+from sixlowham.icmp6 import ICMP6Message
+from sixlowham.rfc1071 import checksum
+
+EXTENSION_HEADERS = (HOP_BY_HOP_HEADER, ROUTING_HEADER, FRAGMENT_HEADER,
+        DEST_OPTIONS_HEADER)
+ICMP6 = 58
+NO_NEXT_HEADER = 59
+UNKNOWN = (6, 17, 253)
+
+# Random chains generated per chain length
+EXAMPLES = 50
+
+
+def randbytes(rnd, size):
+    return bytes(rnd.getrandbits(8) for _ in range(size))
+
+
+def routingheader(rnd, dest):
+    """
+    Generate a routing header (everything after the next header byte) for a
+    datagram sent to `dest`.  Returns the header and the final destination.
+    """
+    kind = rnd.choice(('done', 'type0', 'rpl', 'unknown'))
+    if kind == 'type0':
+        count = rnd.randrange(1, 4)
+        addresses = randbytes(rnd, 16 * count)
+        return (bytes([2 * count, 0, rnd.randrange(1, count + 1)])
+                + bytes(4) + addresses, addresses[-16:])
+    elif kind == 'rpl':
+        # RFC 6554: all but the last address lose CmprI leading octets, the
+        # last loses CmprE, then Pad octets fill up to a multiple of 8.
+        count = rnd.randrange(1, 4)
+        cmpri = rnd.randrange(16)
+        cmpre = rnd.randrange(16)
+        addresses = randbytes(rnd, ((count - 1) * (16 - cmpri)) + 16 - cmpre)
+        pad = -(8 + len(addresses)) % 8
+        ext_len = ((8 + len(addresses) + pad) // 8) - 1
+        return (bytes([ext_len, 3, rnd.randrange(1, count + 1),
+            (cmpri << 4) | cmpre, pad << 4, 0, 0]) + addresses + bytes(pad),
+            dest[:cmpre] + addresses[-(16 - cmpre):])
+
+    ext_len = rnd.randrange(4)
+    if kind == 'done':
+        # Any type, no segments left
+        header = bytes([ext_len, rnd.getrandbits(8), 0])
+    else:
+        # We can't tell the final destination, dumping uses the current one
+        header = bytes([ext_len, 253, rnd.randrange(1, 256)])
+    return (header + randbytes(rnd, 4 + (ext_len * 8)), dest)
+
+
+def checkable(datagram, index):
+    """
+    Return True if IP6Datagram.verify can check the upper-layer checksum of
+    `datagram`: it's not a fragment and routing headers are of known types.
+    """
+    if fragmented(datagram[40:], index):
+        return False
+    for (header_id, offset, length) in index:
+        if (header_id == ROUTING_HEADER) and datagram[40 + offset + 3] \
+                and (datagram[40 + offset + 2] not in (0, 3)):
+            return False
+    return True
+
+
+def makedatagram(rnd, extensions):
+    """
+    Generate a raw IPv6 datagram with the given number of extension headers
+    followed by an upper-layer payload.  Returns the datagram and the
+    expected header index.
+
+    Fragment headers are either atomic (RFC 6946), or the first or a later
+    fragment of a larger datagram.  In the latter cases, everything after
+    the fragment header is expected to be left as one opaque payload.
+    Routing headers with segments left move the final destination that the
+    ICMPv6 checksum is computed over (RFC 8200 section 8.1).
+    """
+    source = randbytes(rnd, 16)
+    dest = randbytes(rnd, 16)
+
+    ids = [rnd.choice(EXTENSION_HEADERS) for _ in range(extensions)]
+    ids.append(rnd.choice((ICMP6, NO_NEXT_HEADER) + UNKNOWN))
+
+    final = dest
+    bodies = []
+    for header_id in ids[:-1]:
+        if header_id == ROUTING_HEADER:
+            (body, final) = routingheader(rnd, final)
+            bodies.append(body)
+        elif header_id == FRAGMENT_HEADER:
+            # Reserved byte, then offset, flags and identification
+            kind = rnd.choice(('atomic', 'first', 'later'))
+            if kind == 'atomic':
+                offset_flags = 0
+            elif kind == 'first':
+                offset_flags = 0x0001
+            else:
+                offset_flags = (rnd.randrange(1, 8192) << 3) \
+                        | rnd.getrandbits(1)
+            bodies.append(b'\x00' + struct.pack('!HL', offset_flags,
+                rnd.getrandbits(32)))
+        else:
+            ext_len = rnd.randrange(4)
+            bodies.append(bytes([ext_len])
+                    + randbytes(rnd, 6 + (ext_len * 8)))
+
+    upper = ids[-1]
+    if upper == ICMP6:
+        # Avoid message types with their own decoders
+        message = bytes([rnd.choice((1, 2, 3, 4, 128, 129)),
+            rnd.getrandbits(8)]) + b'\x00\x00' \
+                    + randbytes(rnd, 8 + rnd.randrange(32))
+        csum = checksum(source + final
+                + struct.pack('!L3xB', len(message), ICMP6) + message)
+        upper_payload = message[:2] + struct.pack('!H', csum) + message[4:]
+    else:
+        upper_payload = randbytes(rnd, rnd.randrange(32))
+
+    payload = b''
+    index = []
+    for (header_id, next_id, body) in zip(ids, ids[1:], bodies):
+        index.append((header_id, len(payload), len(body) + 1))
+        payload += bytes([next_id]) + body
+    index.append((upper, len(payload), len(upper_payload)))
+    payload += upper_payload
+
+    for (position, (header_id, offset, length)) in enumerate(index[:-1]):
+        if (header_id == FRAGMENT_HEADER) \
+                and (payload[offset + 2:offset + 4] != b'\x00\x00'):
+            index[position + 1:] = [(payload[offset], offset + length,
+                len(payload) - offset - length)]
+            break
+
+    header = struct.pack('!LHBB16s16s',
+            0x60000000 | (rnd.getrandbits(8) << 20) | rnd.getrandbits(20),
+            len(payload), ids[0], rnd.getrandbits(8), source, dest)
+    return (header + payload, index)
+
+
+def echorequest(size=64):
+    """
+    Build an ICMPv6 echo request datagram with a valid checksum.
+    """
+    source = bytes(range(16))
+    dest = bytes(range(16, 32))
+    message = b'\x80\x00\x00\x00' + bytes(i & 0xff for i in range(size))
+    csum = checksum(source + dest
+            + struct.pack('!L3xB', len(message), ICMP6) + message)
+    message = message[:2] + struct.pack('!H', csum) + message[4:]
+    return struct.pack('!LHBB16s16s', 0x60000000, len(message), ICMP6, 64,
+            source, dest) + message
+
+
+def fragment(datagram, split):
+    """
+    Split a datagram with no extension headers into two fragments, the
+    first carrying `split` bytes (a multiple of 8) of its payload.
+    """
+    payload = datagram[40:]
+    fragments = []
+    for (offset, more, data) in ((0, 1, payload[:split]),
+            (split, 0, payload[split:])):
+        body = struct.pack('!BxHL', datagram[6], offset | more, 0x1234) \
+                + data
+        fragments.append(datagram[:4] + struct.pack('!HB', len(body),
+            FRAGMENT_HEADER) + datagram[7:40] + body)
+    return fragments
+
+
+def examples(extensions):
+    for seed in range(EXAMPLES):
+        rnd = random.Random((extensions << 16) | seed)
+        yield (seed, rnd) + makedatagram(rnd, extensions)
+
+
+@pytest.mark.parametrize('extensions', range(9))
+def test_walkheaders(extensions):
+    for (seed, rnd, datagram, index) in examples(extensions):
+        assert walkheaders(datagram, datagram[6], 40) \
+                == [(i, o + 40, l) for (i, o, l) in index], seed
+
+
+@pytest.mark.parametrize('extensions', range(9))
+def test_parse_roundtrip(extensions):
+    for (seed, rnd, datagram, index) in examples(extensions):
+        parsed = IP6Datagram.parse(datagram, verify=True)
+        assert [h.this_header for h in parsed.headers] \
+                == [i for (i, o, l) in index], seed
+
+        partial = fragmented(datagram[40:], index)
+        for (position, (header, (header_id, _, _))) in enumerate(
+                zip(parsed.headers, index)):
+            if partial and (position == (len(index) - 1)):
+                expected = RawIP6Payload
+            elif header_id == ICMP6:
+                expected = ICMP6Message
+            elif header_id == NO_NEXT_HEADER:
+                expected = NoNextHeader
+            elif header_id in UNKNOWN:
+                expected = RawIP6Payload
+            else:
+                expected = IP6DatagramHeader
+            assert type(header) is expected, seed
+
+        assert bytes(parsed) == datagram, seed
+
+
+@pytest.mark.parametrize('extensions', range(1, 9))
+def test_truncated_chain(extensions):
+    for (seed, rnd, datagram, index) in examples(extensions):
+        # Cut the datagram somewhere in the extension headers, leaving the
+        # payload length as it was.
+        cut = 40 + rnd.randrange(index[-1][1])
+        truncated = datagram[:cut]
+
+        with pytest.raises(ValueError):
+            walkheaders(truncated, truncated[6], 40)
+        with pytest.raises(ValueError):
+            IP6Datagram.parse(truncated)
+        assert not IP6Datagram.verify(truncated), seed
+
+
+def test_fragmented_echo():
+    datagram = echorequest()
+    assert IP6Datagram.verify(datagram)
+
+    for piece in fragment(datagram, 32):
+        parsed = IP6Datagram.parse(piece)
+        assert [type(h) for h in parsed.headers] \
+                == [IP6DatagramHeader, RawIP6Payload]
+        assert [h.this_header for h in parsed.headers] \
+                == [FRAGMENT_HEADER, ICMP6]
+        assert bytes(parsed) == piece
+
+
+def test_atomic_fragment():
+    datagram = echorequest()
+    body = struct.pack('!BxHL', ICMP6, 0, 0x1234) + datagram[40:]
+    atomic = datagram[:4] + struct.pack('!HB', len(body), FRAGMENT_HEADER) \
+            + datagram[7:40] + body
+
+    parsed = IP6Datagram.parse(atomic)
+    assert [type(h) for h in parsed.headers] \
+            == [IP6DatagramHeader, ICMP6Message]
+
+
+def test_fragment_not_verified():
+    # Neither fragment holds the whole message the checksum covers.
+    for piece in fragment(echorequest(), 32):
+        assert IP6Datagram.verify(piece)
+        IP6Datagram.parse(piece, verify=True)
+
+
+def test_routing_final_destination():
+    rnd = random.Random(0)
+    final = randbytes(rnd, 16)
+    datagram = echorequest()
+    message = datagram[40:]
+    csum = checksum(datagram[8:24] + final
+            + struct.pack('!L3xB', len(message), ICMP6) + message[:2]
+            + b'\x00\x00' + message[4:])
+    message = message[:2] + struct.pack('!H', csum) + message[4:]
+    body = bytes([ICMP6, 2, 0, 1]) + bytes(4) + final + message
+    routed = datagram[:4] + struct.pack('!HB', len(body), ROUTING_HEADER) \
+            + datagram[7:40] + body
+    assert IP6Datagram.verify(routed)
+
+    parsed = IP6Datagram.parse(routed, verify=True)
+    assert bytes(parsed.final_dest) == final
+    assert bytes(parsed) == routed
+
+    # Checked against the current destination once no segments are left.
+    done = bytearray(routed)
+    done[43] = 0
+    assert not IP6Datagram.verify(done)
+
+    # Routing types we don't know aren't checked at all.
+    unknown = bytearray(routed)
+    unknown[42] = 253
+    assert IP6Datagram.verify(unknown)
+
+
+@pytest.mark.parametrize('extensions', range(9))
+def test_corrupt_icmp6_checksum(extensions):
+    for (seed, rnd, datagram, index) in examples(extensions):
+        if index[-1][0] != ICMP6:
+            continue
+
+        corrupt = bytearray(datagram)
+        corrupt[-1] ^= 0x01
+        assert IP6Datagram.verify(datagram), seed
+        if checkable(datagram, index):
+            assert not IP6Datagram.verify(corrupt), seed
+            with pytest.raises(ValueError):
+                IP6Datagram.parse(bytes(corrupt), verify=True)
+        else:
+            assert IP6Datagram.verify(corrupt), seed
@@ -0,0 +1,75 @@
+# vim: set tw=78 et sw=4 ts=4 sts=4 fileencoding=utf-8:
+# SPDX-License-Identifier: GPL-2.0
+
+import random
+
+import pytest
+
+from sixlowham.loadtest import LatencyHistogram, parsesizes, main
+
+from test_agent import standin_path
+
+
+def test_percentile_empty():
+    assert LatencyHistogram().percentile(50) is None
+
+
+def test_percentile_accuracy():
+    rnd = random.Random(0)
+    samples = sorted(rnd.expovariate(1000.0) for _ in range(10000))
+    histogram = LatencyHistogram()
+    for sample in samples:
+        histogram.add(sample)
+
+    assert len(histogram) == len(samples)
+    assert histogram.max == samples[-1]
+    for percent in (1, 50, 90, 99, 99.9):
+        exact = samples[int(len(samples) * percent / 100.0) - 1]
+        assert histogram.percentile(percent) == pytest.approx(exact,
+                rel=0.03), percent
+    assert histogram.percentile(100) == samples[-1]
+
+
+def test_percentile_clamped_to_max():
+    histogram = LatencyHistogram()
+    histogram.add(0.005)
+    assert histogram.percentile(50) == 0.005
+    assert histogram.percentile(100) == 0.005
+
+    # Anything under a microsecond lands in the lowest bucket.
+    histogram = LatencyHistogram()
+    histogram.add(0.0)
+    assert histogram.percentile(50) == 0.0
+
+
+@pytest.mark.parametrize('sizes, expected', [
+    ('64', [64]),
+    ('64,256,1024', [64, 256, 1024]),
+    ('64,256*3,1024', [64, 256, 256, 256, 1024]),
+    ('60-64', [60, 61, 62, 63, 64]),
+])
+def test_parsesizes(sizes, expected):
+    assert parsesizes(sizes) == expected
+
+
+@pytest.mark.parametrize('args', [
+    ['--agent', '6lhagent', '--loss-rate', '0.1'],
+    ['--agent', '6lhagent', '--nak-rate', '0.1'],
+    ['--duration', '5', '--warmup', '5'],
+])
+def test_bad_arguments(args):
+    with pytest.raises(SystemExit) as error:
+        main(args)
+    assert error.value.code == 2
+
+
+@pytest.mark.parametrize('limits, status', [
+    ([], 0),
+    (['--max-tx-p99', '0'], 1),
+    (['--max-tx-queued', '0'], 1),
+])
+def test_exit_status(limits, status, capsys):
+    assert main(['--duration', '0.5', '--warmup', '0.1', '--rate', '100',
+        '--no-tracemalloc'] + limits) == status
+    output = capsys.readouterr().out
+    assert ('FAIL:' in output) == bool(status)
@@ -0,0 +1,209 @@
+# vim: set tw=78 et sw=4 ts=4 sts=4 fileencoding=utf-8:
+# SPDX-License-Identifier: GPL-2.0
+
+import asyncio
+import struct
+
+import pytest
+
+from sixlowham.ethernet import EthernetMACAddress
+from sixlowham.icmp6 import MLDv2Report
+from sixlowham.ip6 import IP6Address, IP6Datagram, HOP_BY_HOP_HEADER
+from sixlowham.multicast import MulticastGroups, ALL_NODES, \
+        ALL_MLDV2_ROUTERS
+from sixlowham.rfc1071 import checksum
+
+from test_agent import standin_path, standin, record, until
+
+ICMP6 = 58
+SOURCE = IP6Address('fe80::211:22ff:fe33:4455')
+GROUP = IP6Address('ff02::1234')
+OTHER_GROUP = IP6Address('ff05::abcd')
+
+
+def mldrecord(record_type, group, sources=(), aux=b''):
+    return struct.pack('!BBH16s', record_type, len(aux) // 4,
+            len(sources), bytes(group)) \
+                    + b''.join(bytes(s) for s in sources) + aux
+
+
+def mldreport(records, count=None):
+    """
+    Build a MLDv2 report datagram, as a host sends it: hop limit 1, with a
+    Router Alert option in a Hop-by-Hop Options header.
+    """
+    if count is None:
+        count = len(records)
+    message = struct.pack('!BBHHH', 143, 0, 0, 0, count) + b''.join(records)
+    csum = checksum(bytes(SOURCE) + bytes(ALL_MLDV2_ROUTERS)
+            + struct.pack('!L3xB', len(message), ICMP6) + message)
+    message = message[:2] + struct.pack('!H', csum) + message[4:]
+
+    # Router Alert (MLD), then a PadN to fill the 8 bytes.
+    hop_by_hop = bytes([ICMP6, 0, 0x05, 0x02, 0x00, 0x00, 0x01, 0x00])
+    payload = hop_by_hop + message
+    return struct.pack('!LHBB16s16s', 0x60000000, len(payload),
+            HOP_BY_HOP_HEADER, 1, bytes(SOURCE),
+            bytes(ALL_MLDV2_ROUTERS)) + payload
+
+
+def parsereport(records, count=None):
+    datagram = IP6Datagram.parse(mldreport(records, count), verify=True)
+    (report,) = [h for h in datagram.headers if isinstance(h, MLDv2Report)]
+    return report
+
+
+def test_eui64_known_answers():
+    mac = EthernetMACAddress('00:11:22:33:44:55')
+    assert IP6Address.fromeui48(mac) == SOURCE
+    assert IP6Address.fromeui48(mac, prefix='2001:db8:1:2::') \
+            == IP6Address('2001:db8:1:2:211:22ff:fe33:4455')
+    # The universal/local bit is inverted, not set.
+    assert IP6Address.fromeui48(EthernetMACAddress('02:00:00:00:00:01')) \
+            == IP6Address('fe80::ff:fe00:1')
+
+
+def test_solicited_node_known_answers():
+    assert SOURCE.solicitednode == IP6Address('ff02::1:ff33:4455')
+    assert IP6Address('2001:db8::1:2:3:4').solicitednode \
+            == IP6Address('ff02::1:ff03:4')
+    assert bytes(IP6Address('ff02::1:ff33:4455').multicastmac) \
+            == b'\x33\x33\xff\x33\x44\x55'
+    assert bytes(ALL_NODES.multicastmac) == b'\x33\x33\x00\x00\x00\x01'
+
+
+def test_mldv2_records():
+    sources = [IP6Address('2001:db8::1'), IP6Address('2001:db8::2')]
+    report = parsereport([
+        mldrecord(MLDv2Report.MODE_IS_INCLUDE, GROUP, sources),
+        mldrecord(MLDv2Report.CHANGE_TO_EXCLUDE_MODE, OTHER_GROUP,
+            aux=bytes(range(8))),
+        mldrecord(MLDv2Report.BLOCK_OLD_SOURCES, GROUP, sources[1:],
+            aux=bytes(4)),
+    ])
+    assert report.records == [
+            (MLDv2Report.MODE_IS_INCLUDE, GROUP, sources),
+            (MLDv2Report.CHANGE_TO_EXCLUDE_MODE, OTHER_GROUP, []),
+            (MLDv2Report.BLOCK_OLD_SOURCES, GROUP, sources[1:]),
+    ]
+
+
+@pytest.mark.parametrize('records, count', [
+    # Claims more records than there are
+    ([mldrecord(MLDv2Report.MODE_IS_EXCLUDE, GROUP)], 2),
+    # Record cut short in the group address
+    ([mldrecord(MLDv2Report.MODE_IS_EXCLUDE, GROUP)[:12]], 1),
+    # Sources or auxiliary data missing
+    ([mldrecord(MLDv2Report.MODE_IS_INCLUDE, GROUP, [SOURCE])[:-1]], 1),
+    ([mldrecord(MLDv2Report.MODE_IS_INCLUDE, GROUP, aux=bytes(8))[:-4]], 1),
+])
+def test_mldv2_truncated_record(records, count):
+    report = parsereport(records, count)
+    with pytest.raises(ValueError):
+        report.records
+
+
+def test_applyreport_include_exclude():
+    groups = MulticastGroups()
+    mac = bytes(GROUP.multicastmac)
+
+    # Including some sources, or excluding none, means listening.
+    groups.applyreport(parsereport([
+        mldrecord(MLDv2Report.MODE_IS_INCLUDE, GROUP, [SOURCE]),
+        mldrecord(MLDv2Report.MODE_IS_EXCLUDE, OTHER_GROUP),
+    ]))
+    assert groups.groups == {GROUP, OTHER_GROUP}
+    assert groups.accepts(mac)
+
+    # Blocking sources leaves things as they are.
+    groups.applyreport(parsereport([
+        mldrecord(MLDv2Report.BLOCK_OLD_SOURCES, GROUP, [SOURCE]),
+    ]))
+    assert groups.groups == {GROUP, OTHER_GROUP}
+
+    # Including no sources is leaving the group.
+    groups.applyreport(parsereport([
+        mldrecord(MLDv2Report.CHANGE_TO_INCLUDE_MODE, GROUP),
+    ]))
+    assert groups.groups == {OTHER_GROUP}
+    assert not groups.accepts(mac)
+
+    groups.applyreport(parsereport([
+        mldrecord(MLDv2Report.ALLOW_NEW_SOURCES, GROUP, [SOURCE]),
+    ]))
+    assert GROUP in groups
+    assert groups.accepts(mac)
+
+    with pytest.raises(TypeError):
+        groups.applyreport(object())
+
+
+def test_join_leave_refcount():
+    groups = MulticastGroups()
+    mac = bytes(ALL_NODES.multicastmac)
+    assert not groups.accepts(mac)
+
+    groups.join(ALL_NODES)
+    groups.join('ff02::1')
+    groups.leave(ALL_NODES)
+    assert ALL_NODES in groups
+    assert groups.accepts(mac)
+
+    groups.leave(ALL_NODES)
+    assert ALL_NODES not in groups
+    assert not groups.accepts(mac)
+
+    # Leaving a group we're not in does nothing.
+    groups.leave(ALL_NODES)
+    groups.join(ALL_NODES)
+    assert groups.accepts(mac)
+
+    # Reported groups are kept separately.
+    groups.applyreport(parsereport([
+        mldrecord(MLDv2Report.MODE_IS_EXCLUDE, ALL_NODES),
+    ]))
+    groups.leave(ALL_NODES)
+    assert groups.accepts(mac)
+
+    # Unicast and broadcast are always accepted.
+    assert groups.accepts(b'\x02\x00\x00\x00\x00\x01')
+    assert groups.accepts(b'\xff' * 6)
+    with pytest.raises(ValueError):
+        groups.join(SOURCE)
+
+
+def test_report_filters_frames():
+    async def run():
+        agent = standin('--loopback', multicast_filter=True)
+        connected = record(agent.connected)
+        received = record(agent.receivedframe)
+        async with agent:
+            await until(lambda: connected)
+            assert agent.multicast.groups \
+                    == {ALL_NODES, agent.if_link_local.solicitednode}
+            source = bytes(agent.if_mac)
+
+            def send(dest, payload=b''):
+                agent.send_ethernet_frame(bytes(dest) + source
+                        + b'\x86\xdd' + payload)
+
+            # The host's report comes back out of the interface, and is
+            # picked up on the way.
+            agent.multicast.join(ALL_MLDV2_ROUTERS)
+            send(ALL_MLDV2_ROUTERS.multicastmac, mldreport([
+                mldrecord(MLDv2Report.CHANGE_TO_EXCLUDE_MODE, GROUP)]))
+            await until(lambda: GROUP in agent.multicast)
+            assert len(received) == 1
+
+            # Frames into the interface now only get through for the
+            # groups it listens to.
+            send(OTHER_GROUP.multicastmac)
+            send(GROUP.multicastmac)
+            send(ALL_NODES.multicastmac)
+            await until(lambda: len(received) == 3)
+            await asyncio.sleep(0.2)
+            assert [bytes(f['frame'])[:6] for f in received[1:]] \
+                    == [bytes(GROUP.multicastmac),
+                            bytes(ALL_NODES.multicastmac)]
+
+    asyncio.run(run())
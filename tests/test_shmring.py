@@ -0,0 +1,117 @@
+# vim: set tw=78 et sw=4 ts=4 sts=4 fileencoding=utf-8:
+# SPDX-License-Identifier: GPL-2.0
+
+import os
+import subprocess
+import sys
+
+import pytest
+
+from sixlowham.shmring import FrameRing, FrameRingOverrun
+
+_ROOT_ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture
+def ring():
+    ring = FrameRing.create(slot_count=8, slot_size=64)
+    yield ring
+    ring.close()
+
+
+def readall(reader):
+    """
+    Read everything available, returning (sequence, frame) tuples and the
+    total number of frames lost to overruns.
+    """
+    frames = []
+    lost = 0
+    while True:
+        try:
+            result = reader.read()
+        except FrameRingOverrun as e:
+            lost += e.lost
+            continue
+        if result is None:
+            return (frames, lost)
+        (seq, view) = result
+        frames.append((seq, bytes(view)))
+        view.release()
+
+
+def test_write_read(ring):
+    with FrameRing.attach(ring.name) as reader:
+        assert (reader.slot_count, reader.slot_size) == (8, 64)
+        assert reader.read() is None
+
+        for i in range(5):
+            assert ring.write(bytes([i]) * (i + 1)) == i
+        assert readall(reader) == ([(i, bytes([i]) * (i + 1))
+            for i in range(5)], 0)
+        assert reader.read() is None
+
+
+def test_overrun(ring):
+    with FrameRing.attach(ring.name) as reader:
+        for i in range(20):
+            ring.write(bytes([i]))
+
+        # The oldest slot may be being rewritten, so only seven of the
+        # eight are readable.
+        (frames, lost) = readall(reader)
+        assert lost == 13
+        assert frames == [(i, bytes([i])) for i in range(13, 20)]
+
+
+def test_valid(ring):
+    with FrameRing.attach(ring.name) as reader:
+        ring.write(b'first')
+        (seq, view) = reader.read()
+        assert reader.valid(seq)
+
+        for i in range(8):
+            ring.write(b'later')
+        assert not reader.valid(seq)
+        view.release()
+
+
+def test_oversized(ring):
+    with pytest.raises(ValueError):
+        ring.write(bytes(65))
+
+
+@pytest.mark.parametrize('size', [8, 64])
+def test_attach_not_a_ring(size):
+    from multiprocessing import shared_memory
+    shm = shared_memory.SharedMemory(create=True, size=size)
+    # Only the mapping made by attach is left to look for.
+    shm.close()
+    try:
+        with pytest.raises(ValueError) as error:
+            FrameRing.attach(shm.name)
+
+        # The traceback still refers to it, so it must have been closed
+        # rather than left for the garbage collector.
+        assert error.traceback
+        if os.path.exists('/proc/self/maps'):
+            with open('/proc/self/maps') as maps:
+                assert shm.name not in maps.read()
+    finally:
+        shm.unlink()
+
+
+def test_reader_process(ring):
+    # A separate process attaching and exiting must not remove the ring.
+    script = ('import sys\n'
+            'from sixlowham.shmring import FrameRing\n'
+            'with FrameRing.attach(sys.argv[1]) as reader:\n'
+            '    print(reader.slot_count)\n')
+    for _ in range(2):
+        result = subprocess.run([sys.executable, '-c', script, ring.name],
+                cwd=_ROOT_, capture_output=True, text=True, check=True)
+        assert result.stdout.strip() == '8'
+        assert not result.stderr
+
+    with FrameRing.attach(ring.name) as reader:
+        ring.write(b'still here')
+        assert readall(reader) == ([(0, b'still here')], 0)